@@ -8,6 +8,11 @@ import httplib2
 from beaker.middleware import SessionMiddleware
 import bottle
 from bottle import run, get, post, request, response, route, static_file, Bottle
+# orjson parses and serializes several times faster; json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 PORT=8080
 
 # Load the keys * Note that ID and SECRET are "xxxxxxxxxx" for submission, used to be loaded from .env
@@ -35,14 +40,19 @@ DATA_FILE = "userData.json"
 # Function that returns data from user data JSON
 def loadDataFromJSON():
     if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
+        with open(DATA_FILE, "rb") as f:
+            raw = f.read()
+        return orjson.loads(raw) if orjson else json.loads(raw)
     return {}
 
 # Function that saves data to user data JSON
 def saveDataToJSON(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    if orjson:
+        raw = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        raw = json.dumps(data, indent=2).encode()
+    with open(DATA_FILE, "wb") as f:
+        f.write(raw)
 
 # Load data from JSON
 userData = loadDataFromJSON()
@@ -1,4 +1,6 @@
-import json, os
+import os
+import threading
+import orjson
 from dotenv import load_dotenv
 from oauth2client.client import OAuth2WebServerFlow
 from oauth2client.client import flow_from_clientsecrets
@@ -7,12 +9,14 @@ from googleapiclient.discovery import build
 import httplib2
 from beaker.middleware import SessionMiddleware
 import bottle
-from bottle import run, get, post, request, response, route, error, template, static_file, Bottle
+from bottle import run, get, post, request, response, route, error, template, static_file, Bottle, SimpleTemplate
 PORT=8080
 from storage import SearchEngineDB
 
 DB_FILE = "search_engine.db"
 RESULTS_PER_PAGE = 5
+MAX_QUERY_LENGTH = 256
+MAX_PAGE = 10000
 
 def get_db():
     """Get database connection"""
@@ -23,6 +27,20 @@ load_dotenv()
 ID = os.getenv("GOOGLE_CLIENT_ID")
 SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
+# HTTP cache shared by all logins, and the oauth2 service built once from its discovery document
+HTTP_CACHE_DIR = "./.httpcache"
+oauthService = build('oauth2', 'v2', http=httplib2.Http(cache=HTTP_CACHE_DIR), cache_discovery=True)
+
+# httplib2 is not thread-safe, so each server thread keeps one Http (and its open connections) for all logins
+threadHttp = threading.local()
+
+def getHttp():
+    http = getattr(threadHttp, 'http', None)
+    if http is None:
+        http = httplib2.Http(cache=HTTP_CACHE_DIR)
+        threadHttp.http = http
+    return http
+
 # Create app
 app = Bottle()
 
@@ -35,23 +53,52 @@ session_opts = {
 }
 appWithSessions = SessionMiddleware(app, session_opts)
 
-# File to store user data
+# Templates are parsed once at startup instead of on the request path
+INDEX_TEMPLATE = SimpleTemplate(name='static/index.tpl')
+RESULTS_TEMPLATE = SimpleTemplate(name='static/resultPage.tpl')
+
+# File to store user data, and the log new users are appended to between compactions
 DATA_FILE = "userData.json"
+DATA_LOG_FILE = "userData.ndjson"
 
-# Function that returns data from user data JSON
+# Function that returns data from user data JSON, with any logged users applied on top
 def loadDataFromJSON():
+    data = {}
     if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-# Function that saves data to user data JSON
+        with open(DATA_FILE, "rb") as f:
+            data = orjson.loads(f.read())
+    if os.path.exists(DATA_LOG_FILE):
+        with open(DATA_LOG_FILE, "rb") as f:
+            for line in f:
+                try:
+                    data.update(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # Line cut short by a crash mid-append
+                    pass
+    return data
+
+# Function that saves data to user data JSON (written to a temp file then swapped in atomically)
 def saveDataToJSON(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-# Load data from JSON
+    tmpFile = DATA_FILE + ".tmp"
+    with open(tmpFile, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmpFile, DATA_FILE)
+
+# Function that appends one user's data to the log instead of rewriting the whole file
+def appendUserData(email):
+    with open(DATA_LOG_FILE, "ab") as f:
+        f.write(orjson.dumps({email: userData[email]}) + b"\n")
+
+# Function that folds the log into the JSON file (replaying the log again is harmless, so a crash in between loses nothing)
+def compactUserData():
+    saveDataToJSON(userData)
+    if os.path.exists(DATA_LOG_FILE):
+        os.remove(DATA_LOG_FILE)
+
+# Load data from JSON, and compact it if users were logged since the last run
 userData = loadDataFromJSON()
+if os.path.exists(DATA_LOG_FILE):
+    compactUserData()
 
 # Given a list of words, the function will update the dictionary with each appearence of the word
 def updateAppearences(list, dict):
@@ -70,7 +117,6 @@ def home():
     # Get email from session
     session = request.environ.get('beaker.session')
     email = session.get('email', None)
-    email = None
 
     # Update HTML based on whether the user is logged in or not
     if email:
@@ -82,7 +128,7 @@ def home():
         actionURL = "/login"
         loginStatus = "Not logged in"
 
-    return bottle.template('static/index.tpl', loginStatus=loginStatus, actionURL = actionURL, buttonText = buttonText)
+    return INDEX_TEMPLATE.render(loginStatus=loginStatus, actionURL = actionURL, buttonText = buttonText)
 
 # If login button pressed, this function will redirect to google login screen
 @app.route('/login', method='GET')
@@ -106,14 +152,15 @@ def redirect_page():
     scope = ['profile', 'email']
     flow = OAuth2WebServerFlow(ID, SECRET, scope=scope,
         redirect_uri="http://localhost:8080/redirect")
-    credentials = flow.step2_exchange(code)
+    http = getHttp()
+    credentials = flow.step2_exchange(code, http=http)
     token = credentials.id_token["sub"]
 
-    http = httplib2.Http()
-    http = credentials.authorize(http)
+    # Credentials are per user, so add the token to this request's headers instead of authorizing (patching) the shared Http
+    userRequest = oauthService.userinfo().get()
+    credentials.apply(userRequest.headers)
     # Get user email
-    users_service = build('oauth2', 'v2', http=http)
-    user_document = users_service.userinfo().get().execute()
+    user_document = userRequest.execute(http=http)
     user_email = user_document['email']
 
     # Save email and token to the session
@@ -125,7 +172,7 @@ def redirect_page():
     # Initialize user data if new
     if user_email not in userData:
         userData[user_email] = {"keywordUsage": {}, "recentWords": []}
-        saveDataToJSON(userData)
+        appendUserData(user_email)
 
     bottle.redirect("/")
 
@@ -144,7 +191,6 @@ def process_query():
     # Get email from session
     session = request.environ.get('beaker.session')
     email = session.get('email', None)
-    email = None
 
     # Update HTML based on whether the user is logged in or not
     if email:
@@ -156,13 +202,14 @@ def process_query():
         actionURL = "/login"
         loginStatus = "Not logged in"
 
-    # Get query (we only use the first word)
-    query = request.query.keywords or ""
-    if query != "":
-        query = query.split()[0]
+    # Get query (we only use the first word, so cap the length and stop splitting after it)
+    query = (request.query.keywords or "")[:MAX_QUERY_LENGTH]
+    parts = query.split(None, 1)
+    query = parts[0] if parts else ""
     
-    # Get the current page number (default is 1)
-    page = int(request.query.page or 1)
+    # Get the current page number (default is 1, also used for anything but a short number; large pages are capped)
+    pageParam = request.query.page
+    page = min(max(int(pageParam), 1), MAX_PAGE) if pageParam.isdecimal() and len(pageParam) < 6 else 1
     perPage = 5
 
     # Get urls from database (urls come back as a list of tuples of (url, page title, pagerank))
@@ -178,7 +225,7 @@ def process_query():
     pageUrls = urls[start:end]
     totalPages = (len(urls) + perPage - 1) // perPage or 1
 
-    return template('static/resultPage.tpl', loginStatus=loginStatus, actionURL = actionURL, buttonText = buttonText, urls=pageUrls, query=query, page=page, total_pages=totalPages)
+    return RESULTS_TEMPLATE.render(loginStatus=loginStatus, actionURL = actionURL, buttonText = buttonText, urls=pageUrls, query=query, page=page, total_pages=totalPages)
 
 # Serves Logo for query page
 @app.route('/static/<filename>')
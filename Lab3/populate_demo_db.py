@@ -3,7 +3,7 @@
 Populate the database with demo data for testing the search engine
 """
 
-from storage import SearchEngineDB
+from storage import SearchEngineDB, normalize_word
 from pagerank import page_rank, normalize_page_rank
 
 def populate_demo_database():
@@ -63,16 +63,27 @@ def populate_demo_database():
         }
     ]
 
-    # Insert documents and words
+    # Insert documents
     doc_ids = {}
     for doc in documents:
         doc_id = db.insert_document(doc['url'], doc['title'])
         doc_ids[doc['url']] = doc_id
 
-        # Insert words into inverted index
-        for word, font_size in doc['words']:
-            word_id = db.insert_word(word)
-            db.insert_inverted_index(word_id, doc_id, font_size)
+    # Insert all words and inverted index entries in a single transaction,
+    # normalized the same way as SearchEngineDB.insert_word()
+    all_words = {normalize_word(word) for doc in documents for word, _ in doc['words']}
+    with db.conn:
+        db.cursor.executemany('INSERT OR IGNORE INTO Lexicon (word) VALUES (?)',
+                              [(word,) for word in all_words])
+        db.cursor.execute('SELECT word, word_id FROM Lexicon')
+        word_ids = dict(db.cursor.fetchall())
+
+        index_rows = [(word_ids[normalize_word(word)], doc_ids[doc['url']], font_size)
+                      for doc in documents for word, font_size in doc['words']]
+        db.cursor.executemany('''
+            INSERT OR REPLACE INTO InvertedIndex (word_id, doc_id, font_size)
+            VALUES (?, ?, ?)
+        ''', index_rows)
 
     print(f"Inserted {len(documents)} documents")
 
@@ -13,6 +13,21 @@ import sqlite3
 import json
 from typing import Dict, List, Tuple, Set, Optional
 
+# ASCII upper -> lower case table, applied with the C-level str.translate
+_LOWER = str.maketrans({c: chr(c + 32) for c in range(ord('A'), ord('Z') + 1)})
+
+
+def normalize_word(word: str) -> str:
+    """
+    Normalize a word to lower case before it touches the lexicon
+
+    Uses the precomputed ASCII table for the common case and falls back to
+    str.casefold() for non-ASCII words.
+    """
+    if word.isascii():
+        return word.translate(_LOWER)
+    return word.casefold()
+
 
 class SearchEngineDB:
     """Database interface for search engine persistent storage"""
@@ -26,7 +41,10 @@ class SearchEngineDB:
         """
         self.db_file = db_file
         self.conn = sqlite3.connect(db_file)
+        # Rows are built in C and still unpack like tuples; fetch in larger batches
+        self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
+        self.cursor.arraysize = 128
         self._create_tables()
 
     def _create_tables(self):
@@ -106,6 +124,7 @@ class SearchEngineDB:
         Returns:
             word_id of the inserted or existing word
         """
+        word = normalize_word(word)
         try:
             self.cursor.execute('INSERT INTO Lexicon (word) VALUES (?)', (word,))
             self.conn.commit()
@@ -185,7 +204,7 @@ class SearchEngineDB:
 
     def get_word_id(self, word: str) -> Optional[int]:
         """Get the word_id for a given word"""
-        self.cursor.execute('SELECT word_id FROM Lexicon WHERE word = ?', (word,))
+        self.cursor.execute('SELECT word_id FROM Lexicon WHERE word = ?', (normalize_word(word),))
         result = self.cursor.fetchone()
         return result[0] if result else None
 
@@ -214,7 +233,7 @@ class SearchEngineDB:
             WHERE l.word = ?
             ORDER BY d.page_rank DESC
             LIMIT ?
-        ''', (word, limit))
+        ''', (normalize_word(word), limit))
         return self.cursor.fetchall()
 
     def get_link_graph(self) -> Dict[int, List[int]]:
@@ -226,7 +245,7 @@ class SearchEngineDB:
         """
         self.cursor.execute('SELECT from_doc_id, to_doc_id FROM LinkGraph')
         links = {}
-        for from_id, to_id in self.cursor.fetchall():
+        for from_id, to_id in self.cursor:
             if from_id not in links:
                 links[from_id] = []
             links[from_id].append(to_id)
@@ -137,6 +137,18 @@ class TestSearchEngineDB(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0][0], "http://example.com")
 
+    def test_search_case_insensitive(self):
+        """Test words are normalized to lower case on insert and search"""
+        word_id1 = self.db.insert_word("Python")
+        word_id2 = self.db.insert_word("python")
+        doc_id = self.db.insert_document("http://example.com")
+
+        self.db.insert_inverted_index(word_id1, doc_id, 5)
+
+        self.assertEqual(word_id1, word_id2)
+        self.assertEqual(self.db.get_word_id("PYTHON"), word_id1)
+        self.assertEqual(len(self.db.search_word("PyThOn")), 1)
+
     def test_link_graph(self):
         """Test link graph operations"""
         doc_id1 = self.db.insert_document("http://example.com/page1")
@@ -11,31 +11,146 @@ This module tracks and analyzes search query patterns including:
 This data helps improve search quality and understand user behavior.
 """
 
+import atexit
+import queue
 import sqlite3
+import threading
 import time
+from pathlib import Path
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
-from collections import defaultdict
+from collections import defaultdict, Counter
 import json
 
+# Hot-path write statements, shared by the single-row and batch methods so each
+# is parsed once and then served from the connection's statement cache
+INSERT_QUERY_SQL = '''
+    INSERT INTO QueryLog (query, timestamp, num_results, response_time_ms, user_ip, user_agent)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_CLICK_SQL = '''
+    INSERT INTO ClickLog (query_id, url, position, timestamp)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Folds a range of logged queries into PopularQueries, reading the normalized
+# text SQLite generated for them
+UPSERT_POPULAR_SQL = '''
+    INSERT INTO PopularQueries (query, count, last_searched)
+    SELECT normalized_query, COUNT(*), MAX(timestamp)
+    FROM QueryLog
+    WHERE query_id BETWEEN ? AND ?
+    GROUP BY normalized_query
+    ON CONFLICT(query) DO UPDATE SET
+        count = count + excluded.count,
+        last_searched = excluded.last_searched
+'''
+
+ADD_CLICKS_SQL = '''
+    UPDATE PopularQueries
+    SET click_count = click_count + ?
+    WHERE query = (SELECT normalized_query FROM QueryLog WHERE query_id = ?)
+'''
+
+STATEMENT_CACHE_SIZE = 256
+
+# How often (seconds) the background thread folds queued PopularQueries updates
+AGGREGATE_INTERVAL = 1.0
+
+# Queries logged with log_query_async are written by a background thread every
+# QUERY_FLUSH_INTERVAL seconds, or as soon as QUERY_FLUSH_SIZE are waiting
+QUERY_QUEUE_SIZE = 4096
+QUERY_FLUSH_SIZE = 64
+QUERY_FLUSH_INTERVAL = 2.0
+
 
 class SearchAnalytics:
     """
     Analytics system for tracking search engine usage and performance
     """
 
-    def __init__(self, db_file: str = 'analytics.db'):
+    def __init__(self, db_file: str = 'analytics.db', batch_size: int = 50, wal: bool = True):
         """
         Initialize analytics database
 
+        With wal=True the database uses write-ahead logging with
+        synchronous=NORMAL: readers no longer block the writer and each
+        commit needs one fsync instead of two. The tradeoff is that the most
+        recent commits may be lost on power failure (never corrupted), which
+        is acceptable for analytics data.
+
+        Writes go through one connection guarded by a lock so that batched
+        commits stay consistent. Reads use a read-only connection per thread,
+        which WAL lets run alongside the writer.
+
+        PopularQueries counters are updated by a background thread that
+        applies queued updates every AGGREGATE_INTERVAL seconds, so a request
+        only pays for its QueryLog/ClickLog insert. Reads apply anything still
+        queued first, so results are never stale.
+
+        log_query_async goes one step further and leaves the QueryLog insert
+        itself to a background writer, which inserts whatever has queued up
+        with one executemany per transaction. Reads and close() (also run at
+        interpreter exit) write out the queue first.
+
         Args:
             db_file: Path to analytics database file
+            batch_size: Number of single-row writes to group into one commit
+            wal: Enable WAL journal mode and relaxed sync (default: True)
         """
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.batch_size = batch_size
+        self._pending_writes = 0
+        self._write_lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False,
+                                    cached_statements=STATEMENT_CACHE_SIZE)
         self.cursor = self.conn.cursor()
+        self._configure(wal)
         self._create_tables()
 
+        # Per-thread read-only connections (an in-memory database can only be
+        # reached through the writer connection)
+        self._local = threading.local()
+        self._readers = []
+        if db_file == ':memory:':
+            self._read_uri = None
+        else:
+            self._read_uri = Path(db_file).resolve().as_uri() + '?mode=ro'
+
+        # Background materialization of PopularQueries
+        self._aggregates = queue.Queue()
+        self._stop_aggregator = threading.Event()
+        self._aggregator = threading.Thread(target=self._aggregator_loop,
+                                            name='analytics-aggregator', daemon=True)
+        self._aggregator.start()
+
+        # Background QueryLog writer for log_query_async
+        self._query_queue = queue.Queue(maxsize=QUERY_QUEUE_SIZE)
+        self._flush_queries = threading.Event()
+        self._stop_writer = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop,
+                                        name='analytics-writer', daemon=True)
+        self._writer.start()
+
+        # Drain the queues at interpreter exit unless close() ran first
+        self._closed = False
+        atexit.register(self.close)
+
+    def _configure(self, wal: bool):
+        """Tune SQLite PRAGMAs for a write-heavy logging workload"""
+        if wal:
+            self.cursor.executescript('''
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+            ''')
+
+        self.cursor.executescript('''
+            PRAGMA temp_store = MEMORY;
+            PRAGMA mmap_size = 268435456;
+            PRAGMA cache_size = -65536;
+        ''')
+
     def _create_tables(self):
         """Create analytics tables"""
 
@@ -44,6 +159,7 @@ class SearchAnalytics:
             CREATE TABLE IF NOT EXISTS QueryLog (
                 query_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 query TEXT NOT NULL,
+                normalized_query TEXT GENERATED ALWAYS AS (LOWER(TRIM(query))) STORED,
                 timestamp REAL NOT NULL,
                 num_results INTEGER DEFAULT 0,
                 response_time_ms REAL,
@@ -70,10 +186,30 @@ class SearchAnalytics:
                 query TEXT PRIMARY KEY,
                 count INTEGER DEFAULT 0,
                 last_searched REAL,
-                avg_ctr REAL DEFAULT 0.0
+                click_count INTEGER DEFAULT 0
             )
         ''')
 
+        # Older databases have no normalized_query column on QueryLog (ALTER TABLE
+        # can only add generated columns as VIRTUAL)
+        self.cursor.execute('PRAGMA table_xinfo(QueryLog)')
+        query_log_columns = {row[1] for row in self.cursor.fetchall()}
+        if 'normalized_query' not in query_log_columns:
+            self.cursor.execute('''
+                ALTER TABLE QueryLog ADD COLUMN
+                normalized_query TEXT GENERATED ALWAYS AS (LOWER(TRIM(query))) VIRTUAL
+            ''')
+
+        # Older databases stored a precomputed avg_ctr instead of click counts
+        self.cursor.execute('PRAGMA table_info(PopularQueries)')
+        popular_columns = {row[1] for row in self.cursor.fetchall()}
+        if 'click_count' not in popular_columns:
+            self.cursor.execute('ALTER TABLE PopularQueries ADD COLUMN click_count INTEGER DEFAULT 0')
+            self.cursor.execute('''
+                UPDATE PopularQueries
+                SET click_count = CAST(ROUND(avg_ctr * count) AS INTEGER)
+            ''')
+
         # Performance Metrics
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS PerformanceMetrics (
@@ -85,14 +221,23 @@ class SearchAnalytics:
         ''')
 
         # Create indexes
+        # Covering index for time-window scans; it also serves plain timestamp lookups,
+        # so the old single-column index is dropped
         self.cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_query_timestamp ON QueryLog(timestamp)
+            CREATE INDEX IF NOT EXISTS idx_ql_ts_covering
+            ON QueryLog(timestamp, num_results, response_time_ms)
         ''')
 
+        self.cursor.execute('DROP INDEX IF EXISTS idx_query_timestamp')
+
         self.cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_query_text ON QueryLog(query)
         ''')
 
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_query_norm ON QueryLog(normalized_query)
+        ''')
+
         self.cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_click_query ON ClickLog(query_id)
         ''')
@@ -108,6 +253,10 @@ class SearchAnalytics:
         """
         Log a search query
 
+        The write is left in the open transaction and committed once
+        batch_size writes are pending (or on flush()/close()), so bursts of
+        queries share a single commit.
+
         Args:
             query: Search query text
             num_results: Number of results returned
@@ -118,22 +267,47 @@ class SearchAnalytics:
         Returns:
             query_id for this logged query
         """
-        timestamp = time.time()
+        with self._write_lock:
+            timestamp = time.time()
 
-        self.cursor.execute('''
-            INSERT INTO QueryLog (query, timestamp, num_results, response_time_ms, user_ip, user_agent)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (query, timestamp, num_results, response_time_ms, user_ip, user_agent))
+            self.cursor.execute(INSERT_QUERY_SQL, (query, timestamp, num_results, response_time_ms, user_ip, user_agent))
 
-        self.conn.commit()
-
-        query_id = self.cursor.lastrowid
+            query_id = self.cursor.lastrowid
+            self._write_done()
 
-        # Update popular queries
-        self._update_popular_query(query, timestamp)
+        # Update popular queries in the background
+        self._aggregates.put(('query', query_id, query_id))
 
         return query_id
 
+    def log_query_async(self, query: str, num_results: int, response_time_ms: float,
+                        user_ip: str = None, user_agent: str = None):
+        """
+        Queue a search query to be logged by the background writer
+
+        Unlike log_query this does no database work on the caller's thread and
+        returns no query_id. If the queue is full the caller writes it out.
+
+        Args:
+            query: Search query text
+            num_results: Number of results returned
+            response_time_ms: Query response time in milliseconds
+            user_ip: User IP address (optional)
+            user_agent: User agent string (optional)
+        """
+        row = (query, time.time(), num_results, response_time_ms, user_ip, user_agent)
+
+        try:
+            self._query_queue.put_nowait(row)
+        except queue.Full:
+            with self._write_lock:
+                self._write_queued_queries()
+                self._insert_queries([row])
+            return
+
+        if self._query_queue.qsize() >= QUERY_FLUSH_SIZE:
+            self._flush_queries.set()
+
     def log_click(self, query_id: int, url: str, position: int):
         """
         Log a click on a search result
@@ -143,65 +317,159 @@ class SearchAnalytics:
             url: URL that was clicked
             position: Position of result in search results (1-indexed)
         """
-        timestamp = time.time()
+        with self._write_lock:
+            timestamp = time.time()
 
-        self.cursor.execute('''
-            INSERT INTO ClickLog (query_id, url, position, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (query_id, url, position, timestamp))
+            self.cursor.execute(INSERT_CLICK_SQL, (query_id, url, position, timestamp))
+            self._write_done()
 
-        self.conn.commit()
+        # Update CTR for this query in the background
+        self._aggregates.put(('click', query_id, 1))
 
-        # Update CTR for this query
-        self._update_query_ctr(query_id)
+    def log_queries_batch(self, queries: List[Tuple[str, int, float, Optional[str], Optional[str]]]) -> int:
+        """
+        Log many search queries in a single transaction
 
-    def _update_popular_query(self, query: str, timestamp: float):
-        """Update popular queries table"""
-        normalized_query = query.lower().strip()
+        Args:
+            queries: List of tuples: (query, num_results, response_time_ms, user_ip, user_agent)
 
-        self.cursor.execute('''
-            INSERT INTO PopularQueries (query, count, last_searched)
-            VALUES (?, 1, ?)
-            ON CONFLICT(query) DO UPDATE SET
-                count = count + 1,
-                last_searched = ?
-        ''', (normalized_query, timestamp, timestamp))
+        Returns:
+            Number of queries logged
+        """
+        timestamp = time.time()
 
-        self.conn.commit()
+        query_rows = [(query, timestamp, num_results, response_time_ms, user_ip, user_agent)
+                      for query, num_results, response_time_ms, user_ip, user_agent in queries]
 
-    def _update_query_ctr(self, query_id: int):
-        """Update click-through rate for a query"""
-        # Get the query text
-        self.cursor.execute('SELECT query FROM QueryLog WHERE query_id = ?', (query_id,))
-        result = self.cursor.fetchone()
+        self._insert_queries(query_rows)
+        return len(query_rows)
 
-        if not result:
-            return
+    def log_clicks_batch(self, clicks: List[Tuple[int, str, int]]) -> int:
+        """
+        Log many result clicks in a single transaction
 
-        query = result[0].lower().strip()
+        Args:
+            clicks: List of tuples: (query_id, url, position)
 
-        # Calculate average CTR
-        self.cursor.execute('''
-            SELECT
-                COUNT(DISTINCT ql.query_id) as total_queries,
-                COUNT(DISTINCT cl.click_id) as total_clicks
-            FROM QueryLog ql
-            LEFT JOIN ClickLog cl ON ql.query_id = cl.query_id
-            WHERE LOWER(ql.query) = ?
-        ''', (query,))
+        Returns:
+            Number of clicks logged
+        """
+        with self._write_lock:
+            timestamp = time.time()
 
-        total_queries, total_clicks = self.cursor.fetchone()
+            with self.conn:
+                self.cursor.executemany(INSERT_CLICK_SQL, [(query_id, url, position, timestamp) for query_id, url, position in clicks])
 
-        if total_queries > 0:
-            avg_ctr = (total_clicks or 0) / total_queries
+            self._pending_writes = 0
 
-            self.cursor.execute('''
-                UPDATE PopularQueries
-                SET avg_ctr = ?
-                WHERE query = ?
-            ''', (avg_ctr, query))
+        # Update CTR once per distinct query, through the same queue as the
+        # PopularQueries rows of logged queries so it is applied after them
+        for query_id, num_clicks in Counter(query_id for query_id, _, _ in clicks).items():
+            self._aggregates.put(('click', query_id, num_clicks))
+
+        return len(clicks)
 
+    def flush(self):
+        """Commit any pending writes to disk"""
+        with self._write_lock:
             self.conn.commit()
+            self._pending_writes = 0
+
+    def _insert_queries(self, query_rows: List[tuple]):
+        """Insert complete QueryLog rows and count them in PopularQueries, in one transaction"""
+        with self._write_lock:
+            with self.conn:
+                # AUTOINCREMENT ids only grow, so the batch is every id past the old maximum
+                self.cursor.execute('SELECT COALESCE(MAX(query_id), 0) FROM QueryLog')
+                first_id = self.cursor.fetchone()[0] + 1
+                self.cursor.executemany(INSERT_QUERY_SQL, query_rows)
+                self.cursor.execute('SELECT MAX(query_id) FROM QueryLog')
+                last_id = self.cursor.fetchone()[0]
+                self._update_popular_query(first_id, last_id)
+
+            self._pending_writes = 0
+
+    def _writer_loop(self):
+        """Write out queued log_query_async rows every interval or once a batch is waiting"""
+        while not self._stop_writer.is_set():
+            self._flush_queries.wait(QUERY_FLUSH_INTERVAL)
+            self._flush_queries.clear()
+            self._write_queued_queries()
+
+    def _write_queued_queries(self):
+        """Insert every row queued by log_query_async"""
+        with self._write_lock:
+            query_rows = []
+            while True:
+                try:
+                    query_rows.append(self._query_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if query_rows:
+                self._insert_queries(query_rows)
+
+    def _aggregator_loop(self):
+        """Periodically fold queued query/click updates into PopularQueries"""
+        while not self._stop_aggregator.wait(AGGREGATE_INTERVAL):
+            self._apply_aggregates()
+
+    def _apply_aggregates(self):
+        """Apply every queued PopularQueries update in one transaction"""
+        with self._write_lock:
+            if self._aggregates.empty():
+                return
+
+            while True:
+                try:
+                    kind, key, value = self._aggregates.get_nowait()
+                except queue.Empty:
+                    break
+
+                if kind == 'query':
+                    self._update_popular_query(key, value)
+                else:
+                    self._update_query_ctr(key, value)
+
+            self.flush()
+
+    def _read_cursor(self) -> sqlite3.Cursor:
+        """Get this thread's read cursor, after committing pending writes"""
+        self._write_queued_queries()
+        self._apply_aggregates()
+        self.flush()
+
+        if self._read_uri is None:
+            return self.cursor
+
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            conn = sqlite3.connect(self._read_uri, uri=True, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            cursor = conn.cursor()
+            self._local.cursor = cursor
+            with self._write_lock:
+                self._readers.append(conn)
+        return cursor
+
+    def _write_done(self):
+        """Count a deferred write and commit once a full batch is pending"""
+        self._pending_writes += 1
+        if self._pending_writes >= self.batch_size:
+            self.flush()
+
+    def _update_popular_query(self, first_id: int, last_id: int):
+        """Count the logged queries with ids first_id..last_id in PopularQueries"""
+        self.cursor.execute(UPSERT_POPULAR_SQL, (first_id, last_id))
+
+    def _update_query_ctr(self, query_id: int, clicks: int = 1):
+        """
+        Add clicks to the click counter of a query
+
+        The CTR itself is derived from click_count / count when read, so a
+        click costs one small UPDATE regardless of history size.
+        """
+        self.cursor.execute(ADD_CLICKS_SQL, (clicks, query_id))
 
     def get_popular_queries(self, limit: int = 10, min_count: int = 1) -> List[Tuple[str, int, float]]:
         """
@@ -214,15 +482,17 @@ class SearchAnalytics:
         Returns:
             List of tuples: (query, count, avg_ctr)
         """
-        self.cursor.execute('''
-            SELECT query, count, avg_ctr
+        cursor = self._read_cursor()
+
+        cursor.execute('''
+            SELECT query, count, CAST(click_count AS REAL) / count AS avg_ctr
             FROM PopularQueries
             WHERE count >= ?
             ORDER BY count DESC
             LIMIT ?
         ''', (min_count, limit))
 
-        return self.cursor.fetchall()
+        return cursor.fetchall()
 
     def get_recent_queries(self, hours: int = 24, limit: int = 100) -> List[Tuple[str, str, int]]:
         """
@@ -235,22 +505,20 @@ class SearchAnalytics:
         Returns:
             List of tuples: (query, timestamp, num_results)
         """
+        cursor = self._read_cursor()
+
         cutoff_time = time.time() - (hours * 3600)
 
-        self.cursor.execute('''
-            SELECT query, timestamp, num_results
+        # Timestamps are formatted by SQLite in local time, like datetime.fromtimestamp
+        cursor.execute('''
+            SELECT query, strftime('%Y-%m-%d %H:%M:%S', timestamp, 'unixepoch', 'localtime'), num_results
             FROM QueryLog
             WHERE timestamp >= ?
             ORDER BY timestamp DESC
             LIMIT ?
         ''', (cutoff_time, limit))
 
-        results = []
-        for query, timestamp, num_results in self.cursor.fetchall():
-            dt = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-            results.append((query, dt, num_results))
-
-        return results
+        return cursor.fetchall()
 
     def get_query_stats(self, query: str) -> Dict[str, any]:
         """
@@ -262,50 +530,51 @@ class SearchAnalytics:
         Returns:
             Dictionary with query statistics
         """
-        normalized_query = query.lower().strip()
+        cursor = self._read_cursor()
 
+        # The query is normalized in SQL the same way as the generated normalized_query column
         # Get total searches
-        self.cursor.execute('''
-            SELECT COUNT(*) FROM QueryLog WHERE LOWER(query) = ?
-        ''', (normalized_query,))
-        total_searches = self.cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT COUNT(*) FROM QueryLog WHERE normalized_query = LOWER(TRIM(?))
+        ''', (query,))
+        total_searches = cursor.fetchone()[0]
 
         # Get total clicks
-        self.cursor.execute('''
+        cursor.execute('''
             SELECT COUNT(*)
             FROM ClickLog cl
             JOIN QueryLog ql ON cl.query_id = ql.query_id
-            WHERE LOWER(ql.query) = ?
-        ''', (normalized_query,))
-        total_clicks = self.cursor.fetchone()[0]
+            WHERE ql.normalized_query = LOWER(TRIM(?))
+        ''', (query,))
+        total_clicks = cursor.fetchone()[0]
 
         # Get average response time
-        self.cursor.execute('''
+        cursor.execute('''
             SELECT AVG(response_time_ms)
             FROM QueryLog
-            WHERE LOWER(query) = ?
-        ''', (normalized_query,))
-        avg_response_time = self.cursor.fetchone()[0] or 0
+            WHERE normalized_query = LOWER(TRIM(?))
+        ''', (query,))
+        avg_response_time = cursor.fetchone()[0] or 0
 
         # Get average number of results
-        self.cursor.execute('''
+        cursor.execute('''
             SELECT AVG(num_results)
             FROM QueryLog
-            WHERE LOWER(query) = ?
-        ''', (normalized_query,))
-        avg_num_results = self.cursor.fetchone()[0] or 0
+            WHERE normalized_query = LOWER(TRIM(?))
+        ''', (query,))
+        avg_num_results = cursor.fetchone()[0] or 0
 
         # Get most clicked URLs
-        self.cursor.execute('''
+        cursor.execute('''
             SELECT cl.url, COUNT(*) as click_count
             FROM ClickLog cl
             JOIN QueryLog ql ON cl.query_id = ql.query_id
-            WHERE LOWER(ql.query) = ?
+            WHERE ql.normalized_query = LOWER(TRIM(?))
             GROUP BY cl.url
             ORDER BY click_count DESC
             LIMIT 5
-        ''', (normalized_query,))
-        top_clicks = self.cursor.fetchall()
+        ''', (query,))
+        top_clicks = cursor.fetchall()
 
         ctr = (total_clicks / total_searches * 100) if total_searches > 0 else 0
 
@@ -329,34 +598,30 @@ class SearchAnalytics:
         Returns:
             Dictionary with performance metrics
         """
-        cutoff_time = time.time() - (hours * 3600)
+        cursor = self._read_cursor()
 
-        # Total queries
-        self.cursor.execute('''
-            SELECT COUNT(*) FROM QueryLog WHERE timestamp >= ?
-        ''', (cutoff_time,))
-        total_queries = self.cursor.fetchone()[0]
-
-        # Average response time
-        self.cursor.execute('''
-            SELECT AVG(response_time_ms) FROM QueryLog WHERE timestamp >= ?
-        ''', (cutoff_time,))
-        avg_response_time = self.cursor.fetchone()[0] or 0
+        cutoff_time = time.time() - (hours * 3600)
 
-        # Queries with zero results
-        self.cursor.execute('''
-            SELECT COUNT(*) FROM QueryLog
-            WHERE timestamp >= ? AND num_results = 0
+        # Total queries, average response time and zero-result queries in one range scan
+        cursor.execute('''
+            SELECT
+                COUNT(*),
+                AVG(response_time_ms),
+                SUM(CASE WHEN num_results = 0 THEN 1 ELSE 0 END)
+            FROM QueryLog
+            WHERE timestamp >= ?
         ''', (cutoff_time,))
-        zero_result_queries = self.cursor.fetchone()[0]
+        total_queries, avg_response_time, zero_result_queries = cursor.fetchone()
+        avg_response_time = avg_response_time or 0
+        zero_result_queries = zero_result_queries or 0
 
         # Total clicks
-        self.cursor.execute('''
+        cursor.execute('''
             SELECT COUNT(*)
             FROM ClickLog
             WHERE timestamp >= ?
         ''', (cutoff_time,))
-        total_clicks = self.cursor.fetchone()[0]
+        total_clicks = cursor.fetchone()[0]
 
         overall_ctr = (total_clicks / total_queries * 100) if total_queries > 0 else 0
         zero_result_rate = (zero_result_queries / total_queries * 100) if total_queries > 0 else 0
@@ -379,19 +644,36 @@ class SearchAnalytics:
             metric_name: Name of the metric
             metric_value: Value of the metric
         """
-        timestamp = time.time()
+        with self._write_lock:
+            timestamp = time.time()
 
-        self.cursor.execute('''
-            INSERT INTO PerformanceMetrics (metric_name, metric_value, timestamp)
-            VALUES (?, ?, ?)
-        ''', (metric_name, metric_value, timestamp))
-
-        self.conn.commit()
+            self.cursor.execute('''
+                INSERT INTO PerformanceMetrics (metric_name, metric_value, timestamp)
+                VALUES (?, ?, ?)
+            ''', (metric_name, metric_value, timestamp))
+            self._write_done()
 
     def close(self):
-        """Close database connection"""
-        self.conn.commit()
-        self.conn.close()
+        """Close database connections (later calls do nothing)"""
+        with self._write_lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        atexit.unregister(self.close)
+        self._stop_writer.set()
+        self._flush_queries.set()
+        self._writer.join()
+        self._stop_aggregator.set()
+        self._aggregator.join()
+        self._write_queued_queries()
+        self._apply_aggregates()
+        self.flush()
+        with self._write_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            self.conn.close()
 
     def __enter__(self):
         """Context manager entry"""
@@ -4,16 +4,23 @@ AWS One-Click Deployment Script for ECE326 Lab 4
 Deploys the search engine to AWS EC2 with a single command
 """
 
-import boto3
+import gzip
+import hashlib
+import json
 import os
 import sys
 import time
+import socket
 import subprocess
-from datetime import datetime
-from dotenv import load_dotenv
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # Configuration
 CREDENTIALS_FILE = 'aws_credentials.env'
+CREDENTIAL_CACHE_FILE = os.path.expanduser('~/.cache/ece326-deploy.json')
+CREDENTIAL_CACHE_TTL = 3600  # seconds
 REQUIRED_FILES = [
     'frontend.py',
     'storage.py',
@@ -26,9 +33,31 @@ REQUIRED_FILES = [
     'requirements.txt',
 ]
 REQUIRED_DIRS = ['static']
-OPTIONAL_FILES = ['backend.py', '.env', 'client_secret.json']
+OPTIONAL_FILES = ['backend.py', '.env', 'client_secret.json', '_lru_c.pyx']
 EC2_USER = 'ubuntu'
 APP_PORT = 8080
+SSH_WAIT_TIMEOUT = 120
+
+# Options for every ssh call. Outside Windows (whose OpenSSH lacks multiplexing)
+# all calls share one master connection, so only the first one pays for the
+# TCP connect, key exchange and authentication
+SSH_OPTS = ['-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'ConnectTimeout=30',
+            '-o', 'IdentitiesOnly=yes']
+if os.name != 'nt':
+    SSH_OPTS += ['-o', 'ControlMaster=auto',
+                 '-o', 'ControlPath=/tmp/ece326-cm-%r@%h:%p',
+                 '-o', 'ControlPersist=600s']
+
+# Options for the botocore Config shared by every boto3 client: adaptive retries
+# back off to the real throttling rate, and pooled keep-alive connections are
+# reused across calls and retries
+BOTO_CONFIG_OPTIONS = {
+    'retries': {'max_attempts': 10, 'mode': 'adaptive'},
+    'max_pool_connections': 16,
+    'tcp_keepalive': True,
+}
 
 
 def print_header(message):
@@ -44,22 +73,33 @@ def print_step(step_num, message):
     print("-" * 70)
 
 
+def _load_env(path):
+    """Set KEY=value pairs from an env file, keeping variables already in the environment"""
+    with open(path) as f:
+        for line in f:
+            if '=' in line and not line.lstrip().startswith('#'):
+                key, value = line.rstrip().split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip().strip('"\''))
+
+
+@lru_cache(maxsize=None)
 def load_aws_credentials():
-    """Load AWS credentials from environment file"""
-    if not os.path.exists(CREDENTIALS_FILE):
-        print(f"❌ Error: {CREDENTIALS_FILE} not found!")
-        print(f"\nPlease create {CREDENTIALS_FILE} from the template:")
-        print(f"  1. Copy aws_credentials.env.template to {CREDENTIALS_FILE}")
-        print(f"  2. Fill in your AWS credentials")
-        print(f"  3. Run this script again")
-        sys.exit(1)
-    
-    load_dotenv(CREDENTIALS_FILE)
-    
-    # Validate required credentials
+    """Load AWS credentials from the environment, reading the environment file only if needed"""
     required_vars = ['AWS_ACCESS_KEY', 'AWS_SECRET_KEY', 'AWS_REGION', 
                      'KEY_NAME', 'SECURITY_GROUP_NAME']
     
+    if not all(os.getenv(var) for var in required_vars):
+        if not os.path.exists(CREDENTIALS_FILE):
+            print(f"❌ Error: {CREDENTIALS_FILE} not found!")
+            print(f"\nPlease create {CREDENTIALS_FILE} from the template:")
+            print(f"  1. Copy aws_credentials.env.template to {CREDENTIALS_FILE}")
+            print(f"  2. Fill in your AWS credentials")
+            print(f"  3. Run this script again")
+            sys.exit(1)
+        
+        _load_env(CREDENTIALS_FILE)
+    
+    # Validate required credentials
     missing = [var for var in required_vars if not os.getenv(var)]
     if missing:
         print(f"❌ Error: Missing required variables in {CREDENTIALS_FILE}:")
@@ -79,18 +119,29 @@ def load_aws_credentials():
 
 
 def check_required_files():
-    """Check that all required files exist"""
+    """Check that all required files exist and return {path: True} for every deployable path present"""
     print("Checking required files...")
     missing_files = []
     
+    # One directory read; scandir gets the entry types without a stat per file
+    wanted_files = set(REQUIRED_FILES + OPTIONAL_FILES)
+    wanted_dirs = set(REQUIRED_DIRS + ['sessions'])
+    present = {}
+    with os.scandir('.') as it:
+        for entry in it:
+            if entry.name in wanted_files and entry.is_file():
+                present[entry.name] = True
+            elif entry.name in wanted_dirs and entry.is_dir():
+                present[entry.name] = True
+    
     for file in REQUIRED_FILES:
-        if not os.path.exists(file):
+        if not present.get(file):
             missing_files.append(file)
         else:
             print(f"  ✓ {file}")
     
     for dir_name in REQUIRED_DIRS:
-        if not os.path.isdir(dir_name):
+        if not present.get(dir_name):
             missing_files.append(f"{dir_name}/ (directory)")
         else:
             print(f"  ✓ {dir_name}/")
@@ -102,30 +153,60 @@ def check_required_files():
         sys.exit(1)
     
     print("✓ All required files present")
+    return present
+
+
+def verify_credentials(session, access_key, boto_config):
+    """Check credentials with STS, skipping the call if they were verified within the last hour"""
+    key_sha = hashlib.sha256(access_key.encode()).hexdigest()
+    
+    try:
+        with open(CREDENTIAL_CACHE_FILE) as f:
+            cached = json.load(f)
+        if (cached.get('access_key_sha') == key_sha and
+                time.time() - cached.get('verified_at', 0) < CREDENTIAL_CACHE_TTL):
+            return cached.get('account_id')
+    except (OSError, ValueError):
+        pass
+    
+    # STS is cheaper than an EC2 call and returns the account ID
+    account_id = session.client('sts', config=boto_config).get_caller_identity()['Account']
+    
+    try:
+        os.makedirs(os.path.dirname(CREDENTIAL_CACHE_FILE), exist_ok=True)
+        with open(CREDENTIAL_CACHE_FILE, 'w') as f:
+            json.dump({'access_key_sha': key_sha, 'verified_at': time.time(),
+                       'account_id': account_id}, f)
+    except OSError:
+        pass  # Caching is only an optimization
+    
+    return account_id
 
 
 def create_ec2_clients(config):
-    """Create EC2 client and resource"""
+    """Create a session and the EC2 client and resource that share it"""
+    # boto3 is imported here rather than at module level since it takes a
+    # noticeable part of a second to load
+    import boto3
+    from botocore.config import Config
+    
     try:
-        client = boto3.client(
-            'ec2',
-            region_name=config['region'],
-            aws_access_key_id=config['access_key'],
-            aws_secret_access_key=config['secret_key']
-        )
+        boto_config = Config(**BOTO_CONFIG_OPTIONS)
         
-        resource = boto3.resource(
-            'ec2',
-            region_name=config['region'],
+        # One session means credentials and endpoints are resolved once for every client
+        session = boto3.Session(
             aws_access_key_id=config['access_key'],
-            aws_secret_access_key=config['secret_key']
+            aws_secret_access_key=config['secret_key'],
+            region_name=config['region']
         )
         
-        # Test connection
-        client.describe_regions()
-        print("✓ AWS connection successful")
+        client = session.client('ec2', config=boto_config)
+        resource = session.resource('ec2', config=boto_config)
+        
+        account_id = verify_credentials(session, config['access_key'], boto_config)
+        print(f"✓ AWS connection successful (account {account_id})")
         
-        return client, resource
+        return session, client, resource
     except Exception as e:
         print(f"❌ Error connecting to AWS: {e}")
         sys.exit(1)
@@ -227,40 +308,33 @@ def setup_security_group(client, sg_name):
             Description='Security group for ECE326 search engine'
         )
         sg_id = response['GroupId']
+        existing_rules = []  # A new group starts without ingress rules
         print(f"✓ Security group created: {sg_id}")
         
     except client.exceptions.ClientError as e:
         if 'InvalidGroup.Duplicate' in str(e):
-            # Get existing security group
+            # Get existing security group, along with its current rules
             response = client.describe_security_groups(
                 Filters=[{'Name': 'group-name', 'Values': [sg_name]}]
             )
             sg_id = response['SecurityGroups'][0]['GroupId']
+            existing_rules = response['SecurityGroups'][0]['IpPermissions']
             print(f"✓ Using existing security group: {sg_id}")
         else:
             raise
     
     # ALWAYS ensure rules are configured (in case they were removed)
-    # First, get current rules
-    try:
-        sg_info = client.describe_security_groups(GroupIds=[sg_id])
-        existing_rules = sg_info['SecurityGroups'][0]['IpPermissions']
-        
-        # Check if SSH rule exists
-        ssh_exists = any(
-            rule.get('IpProtocol') == 'tcp' and 
-            rule.get('FromPort') == 22 and 
-            rule.get('ToPort') == 22 and
-            any(ip_range.get('CidrIp') == '0.0.0.0/0' for ip_range in rule.get('IpRanges', []))
-            for rule in existing_rules
-        )
-        
-        if not ssh_exists:
-            print(f"⚠️  SSH rule missing, adding it now...")
-        
-    except Exception as e:
-        print(f"⚠️  Could not verify existing rules: {e}")
-        ssh_exists = False
+    # Check if SSH rule exists
+    ssh_exists = any(
+        rule.get('IpProtocol') == 'tcp' and 
+        rule.get('FromPort') == 22 and 
+        rule.get('ToPort') == 22 and
+        any(ip_range.get('CidrIp') == '0.0.0.0/0' for ip_range in rule.get('IpRanges', []))
+        for rule in existing_rules
+    )
+    
+    if not ssh_exists:
+        print(f"⚠️  SSH rule missing, adding it now...")
     
     # Configure security rules (will skip duplicates automatically)
     rules_to_add = [
@@ -287,19 +361,32 @@ def setup_security_group(client, sg_name):
         },
     ]
     
-    for rule in rules_to_add:
-        try:
-            client.authorize_security_group_ingress(
-                GroupId=sg_id,
-                IpPermissions=[rule]
-            )
-            port = rule['FromPort']
-            print(f"✓ Added rule for port {port}")
-        except client.exceptions.ClientError as e:
-            if 'InvalidPermission.Duplicate' in str(e):
-                pass  # Rule already exists, that's fine
-            else:
-                print(f"⚠️  Warning adding rule for port {rule['FromPort']}: {e}")
+    # Add all rules in one call; EC2 rejects the whole batch if any rule
+    # already exists, so only then fall back to adding them one at a time
+    try:
+        client.authorize_security_group_ingress(
+            GroupId=sg_id,
+            IpPermissions=rules_to_add
+        )
+        for rule in rules_to_add:
+            print(f"✓ Added rule for port {rule['FromPort']}")
+    except client.exceptions.ClientError as e:
+        if 'InvalidPermission.Duplicate' not in str(e):
+            print(f"⚠️  Warning adding rules: {e}")
+        else:
+            for rule in rules_to_add:
+                try:
+                    client.authorize_security_group_ingress(
+                        GroupId=sg_id,
+                        IpPermissions=[rule]
+                    )
+                    port = rule['FromPort']
+                    print(f"✓ Added rule for port {port}")
+                except client.exceptions.ClientError as e:
+                    if 'InvalidPermission.Duplicate' in str(e):
+                        pass  # Rule already exists, that's fine
+                    else:
+                        print(f"⚠️  Warning adding rule for port {rule['FromPort']}: {e}")
     
     # Verify SSH is now accessible
     print(f"✓ Security group configured with SSH (22), HTTP (80), and App (8080)")
@@ -308,7 +395,7 @@ def setup_security_group(client, sg_name):
 
 
 def launch_instance(resource, config, sg_id):
-    """Launch EC2 instance"""
+    """Launch EC2 instance and return its description (InstanceId, PublicIpAddress, ...)"""
     print(f"Launching EC2 instance...")
     print(f"  Instance type: {config['instance_type']}")
     print(f"  AMI: {config['ami_id']}")
@@ -326,186 +413,215 @@ def launch_instance(resource, config, sg_id):
     print(f"✓ Instance created: {instance.id}")
     print(f"⏳ Waiting for instance to start (this may take 1-2 minutes)...")
     
-    instance.wait_until_running()
-    instance.reload()
+    # Poll every 3s instead of the default waiter's 15s
+    client = resource.meta.client
+    waiter = client.get_waiter('instance_running')
+    waiter.wait(InstanceIds=[instance.id], WaiterConfig={'Delay': 3, 'MaxAttempts': 60})
+    
+    # One describe call for the addresses, rather than reloading the resource
+    # and lazy-loading attributes from it
+    response = client.describe_instances(InstanceIds=[instance.id])
+    instance_info = response['Reservations'][0]['Instances'][0]
     
     print(f"✓ Instance is running!")
-    print(f"  Instance ID: {instance.id}")
-    print(f"  Public IP: {instance.public_ip_address}")
+    print(f"  Instance ID: {instance_info['InstanceId']}")
+    print(f"  Public IP: {instance_info.get('PublicIpAddress')}")
     
-    return instance
+    return instance_info
 
 
-def wait_for_ssh(ip_address, key_file):
-    """Wait for SSH to become available - simplified for Windows compatibility"""
-    print(f"⏳ Waiting for instance to fully initialize...")
-    print(f"   EC2 instances typically take 2-3 minutes after 'running' status")
-    print(f"   Waiting 30 seconds to ensure SSH is ready...")
+def wait_for_ssh(ip_address, key_file, timeout=SSH_WAIT_TIMEOUT):
+    """Wait for SSH to become available by probing port 22 until sshd accepts connections"""
+    print(f"⏳ Waiting for SSH on {ip_address}:22 (up to {timeout} seconds)...")
     
-    # Simple time-based wait since Windows subprocess SSH detection is unreliable
-    # But actual SSH commands work fine once instance is ready
-    for i in range(6):
-        time.sleep(5)
-        print(f"   {(i+1)*5}/30 seconds elapsed...")
-    
-    print(f"✓ Initial wait complete, proceeding with deployment")
+    start = time.time()
+    deadline = start + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((ip_address, 22), timeout=2).close()
+            print(f"✓ SSH is accepting connections after {time.time() - start:.0f} seconds")
+            open_ssh_master(ip_address, key_file)
+            return True
+        except OSError:
+            time.sleep(1)
+    
+    print(f"⚠️  SSH did not respond within {timeout} seconds, proceeding anyway")
     print(f"   (If SSH fails, instance may need a few more seconds)")
-    return True  # Always return True, let actual SSH commands handle failures
+    return False
 
 
-def copy_files_to_instance(ip_address, key_file):
-    """Copy all required files to EC2 instance"""
-    print(f"Copying files to EC2 instance...")
-    
-    # Helper function to copy with retries
-    def scp_with_retry(files, is_dir=False, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                for file in files if isinstance(files, list) else [files]:
-                    if not os.path.exists(file):
-                        continue
-                    
-                    cmd = ['scp', '-i', key_file, '-o', 'StrictHostKeyChecking=no',
-                           '-o', 'UserKnownHostsFile=/dev/null',
-                           '-o', 'ConnectTimeout=30']
-                    
-                    if is_dir:
-                        cmd.append('-r')
-                    
-                    cmd.extend([file, f'{EC2_USER}@{ip_address}:~/'])
-                    
-                    result = subprocess.run(cmd, capture_output=True, encoding='utf-8', 
-                                          errors='replace', timeout=60)
-                    
-                    if result.returncode == 0:
-                        print(f"  ✓ {file}")
-                    else:
-                        if attempt == max_retries - 1:  # Last attempt
-                            if file in REQUIRED_FILES or file in REQUIRED_DIRS:
-                                print(f"  ❌ Failed to copy {file}")
-                                return False
-                return True
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"  Retry {attempt + 1}/{max_retries} for files...")
-                    time.sleep(10)
-                else:
-                    return False
-        return True
+def open_ssh_master(ip_address, key_file):
+    """Start the shared SSH master connection in the background"""
+    if os.name == 'nt':
+        return
     
-    # Copy individual files
-    if not scp_with_retry(REQUIRED_FILES + OPTIONAL_FILES):
-        return False
+    # A failure here is harmless: the next ssh call opens the master itself
+    try:
+        # Output goes to DEVNULL: with pipes, run() would wait on the forked master
+        subprocess.run(['ssh', '-i', key_file, *SSH_OPTS, '-fN', f'{EC2_USER}@{ip_address}'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+    except Exception:
+        pass
+
+
+def close_ssh_master(ip_address, key_file):
+    """Shut down the shared SSH master connection"""
+    if os.name == 'nt':
+        return
     
-    # Copy directories
-    if not scp_with_retry(REQUIRED_DIRS, is_dir=True):
-        return False
+    try:
+        subprocess.run(['ssh', '-i', key_file, *SSH_OPTS, '-O', 'exit', f'{EC2_USER}@{ip_address}'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+    except Exception:
+        pass
+
+
+def build_bundle(present):
+    """
+    Pack every deployable file into a gzipped tarball in the temp directory
+
+    Returns:
+        Tuple of (tarball path, list of packed files and directories)
+    """
+    # Everything that exists locally goes in the bundle (sessions only if present)
+    files = [file for file in REQUIRED_FILES + OPTIONAL_FILES + REQUIRED_DIRS + ['sessions']
+             if present.get(file)]
     
-    # Copy sessions directory if it exists
-    if os.path.isdir('sessions'):
-        scp_with_retry(['sessions'], is_dir=True)
+    fd, tarball = tempfile.mkstemp(prefix='ece326-deploy-', suffix='.tar.gz')
+    # gzip level 1 still shrinks the SQLite databases several times over at a
+    # fraction of the default level's CPU cost
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=1) as gz:
+                with tarfile.open(fileobj=gz, mode='w|') as tar:
+                    for file in files:
+                        tar.add(file)
+    except BaseException:
+        os.remove(tarball)
+        raise
     
-    print("✓ All files copied successfully")
-    return True
+    return tarball, files
 
 
-def install_dependencies(ip_address, key_file):
-    """Install dependencies on EC2 instance"""
-    print(f"Installing dependencies on EC2 instance...")
+def remove_bundle(bundle_future):
+    """Wait for build_bundle() to finish and delete its tarball, however the deploy ended"""
+    try:
+        tarball, _ = bundle_future.result()
+    except Exception:
+        return  # build_bundle() already removed its partial tarball
+    try:
+        os.remove(tarball)
+    except OSError:
+        pass
+
+
+def copy_files_to_instance(ip_address, key_file, bundle):
+    """Copy the prebuilt file bundle to EC2 instance and unpack it in one SSH call"""
+    print(f"Copying files to EC2 instance...")
+    tarball, files = bundle
     
-    install_script = """
-    sudo apt update
-    sudo apt install -y python3-pip
-    pip3 install -r requirements.txt
-    """
+    # The tarball is piped into a remote tar, so it works without rsync or scp -r quirks (Windows)
+    cmd = ['ssh', '-i', key_file, *SSH_OPTS, f'{EC2_USER}@{ip_address}', 'tar -xzf - -C ~']
     
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            cmd = ['ssh', '-i', key_file, '-o', 'StrictHostKeyChecking=no',
-                   '-o', 'UserKnownHostsFile=/dev/null',
-                   '-o', 'ConnectTimeout=30',
-                   '-o', 'IdentitiesOnly=yes']
-            
-            # Add verbose flag on last attempt to debug
-            if attempt == max_retries - 1:
-                cmd.append('-v')
-                
-            cmd.extend([f'{EC2_USER}@{ip_address}', install_script])
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+            with open(tarball, 'rb') as f:
+                result = subprocess.run(cmd, stdin=f, capture_output=True, timeout=300)
             
             if result.returncode == 0:
-                print("✓ Dependencies installed successfully")
+                for file in files:
+                    print(f"  ✓ {file}")
+                print("✓ All files copied successfully")
                 return True
-            else:
-                # Only print error on last attempt or if it's not a connection error
-                if attempt == max_retries - 1:
-                    print(f"❌ Failed to install dependencies")
-                    print(f"Error: {result.stderr}")
-                    # Also print stdout in case verbose info is there
-                    if result.stdout:
-                        print(f"Output: {result.stdout}")
-                else:
-                    print(f"  ⚠️  Attempt {attempt + 1}/{max_retries} failed. Retrying in 10s...")
-                    time.sleep(10)
+            
+            error = result.stderr.decode('utf-8', errors='replace')
         except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"❌ Exception during dependency installation: {e}")
-            else:
-                print(f"  ⚠️  Attempt {attempt + 1}/{max_retries} error: {e}. Retrying in 10s...")
-                time.sleep(10)
-                
+            error = str(e)
+        
+        if attempt < max_retries - 1:
+            print(f"  ⚠️  Attempt {attempt + 1}/{max_retries} failed. Retrying in 10s...")
+            time.sleep(10)
+        else:
+            print(f"❌ Failed to copy files")
+            print(f"Error: {error}")
+    
     return False
 
 
-def start_application(ip_address, key_file):
-    """Start the search engine application"""
-    print(f"Starting search engine application...")
+def deploy_and_start(ip_address, key_file):
+    """Install dependencies and start the search engine in a single SSH session"""
+    print(f"Installing dependencies and starting the application...")
     
-    startup_script = """
+    # apt is skipped entirely when the AMI already ships pip3; otherwise index
+    # downloads are pipelined and recommended packages are left out
+    install_script = """
+    export DEBIAN_FRONTEND=noninteractive
+    if ! command -v pip3 > /dev/null; then
+        sudo -E apt-get -o Dpkg::Use-Pty=0 -o Acquire::Queue-Mode=host -o Acquire::http::Pipeline-Depth=10 update
+        sudo -E apt-get -o Dpkg::Use-Pty=0 install -y --no-install-recommends python3-pip
+    fi
+    pip3 install --no-cache-dir --disable-pip-version-check -r requirements.txt
+    # Build the compiled query cache if Cython is already on the image (it is not in
+    # requirements.txt, and cache.py falls back to pure Python without it)
+    if [ -f _lru_c.pyx ] && command -v cythonize > /dev/null; then
+        cythonize -q -i -3 _lru_c.pyx || true
+    fi
+    """
+    
+    # ssh runs this script as `bash -c '<script>'`, so the script text (which
+    # mentions frontend.py) is on that shell's command line; the anchored
+    # pattern only matches a process whose command line starts with the
+    # frontend's own `python3 frontend.py`
+    startup_script = f"""
     # Kill any existing frontend
-    pkill -f frontend.py || true
+    pkill -f '^python3 frontend\\.py' || true
     
-    # Start frontend in background
+    # Start frontend in background, keeping its pid for the checks below
     nohup python3 frontend.py > frontend.log 2>&1 &
+    pid=$!
     
-    # Wait for server to start
-    sleep 5
+    # Wait up to 5s for the server to start, returning early once it
+    # accepts connections or has already exited
+    for i in $(seq 1 10); do
+        (exec 3<>/dev/tcp/127.0.0.1/{APP_PORT}) 2>/dev/null && break
+        kill -0 "$pid" 2> /dev/null || break
+        sleep 0.5
+    done
     
     # Check if server is running
-    if ps aux | grep -v grep | grep frontend.py > /dev/null; then
+    if kill -0 "$pid" 2> /dev/null; then
         echo "SUCCESS"
     else
         echo "FAILED"
         echo "=== Frontend Log ==="
-        cat frontend.log || echo "No log file found"
+        tail -n 100 frontend.log || echo "No log file found"
         exit 1
     fi
     """
     
+    # set -e stops at the first failed install command
+    remote_script = "set -e\n" + install_script + startup_script
+    
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            cmd = ['ssh', '-i', key_file, '-o', 'StrictHostKeyChecking=no',
-                   '-o', 'UserKnownHostsFile=/dev/null',
-                   '-o', 'ConnectTimeout=30',
-                   '-o', 'IdentitiesOnly=yes']
+            cmd = ['ssh', '-i', key_file, *SSH_OPTS]
             
             # Add verbose flag on last attempt to debug
             if attempt == max_retries - 1:
                 cmd.append('-v')
                 
-            cmd.extend([f'{EC2_USER}@{ip_address}', startup_script])
+            cmd.extend([f'{EC2_USER}@{ip_address}', remote_script])
             
             result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
             
             if result.returncode == 0 and 'SUCCESS' in result.stdout:
-                print("✓ Application started successfully")
+                print("✓ Dependencies installed and application started successfully")
                 return True
             else:
                 if attempt == max_retries - 1:
-                    print(f"❌ Failed to start application")
+                    print(f"❌ Failed to install dependencies or start application")
                     print(f"Output: {result.stdout}")
                     print(f"Error: {result.stderr}")
                 else:
@@ -513,7 +629,7 @@ def start_application(ip_address, key_file):
                     time.sleep(10)
         except Exception as e:
             if attempt == max_retries - 1:
-                print(f"❌ Exception starting application: {e}")
+                print(f"❌ Exception during installation/startup: {e}")
             else:
                 print(f"  ⚠️  Attempt {attempt + 1}/{max_retries} error: {e}. Retrying in 10s...")
                 time.sleep(10)
@@ -531,11 +647,11 @@ def main():
     
     # Step 2: Check files
     print_step(2, "Checking Required Files")
-    check_required_files()
+    present_files = check_required_files()
     
     # Step 3: Connect to AWS
     print_step(3, "Connecting to AWS")
-    ec2_client, ec2_resource = create_ec2_clients(config)
+    session, ec2_client, ec2_resource = create_ec2_clients(config)
     
     # Step 4: Setup key pair (create or reuse)
     print_step(4, "Setting Up Key Pair")
@@ -547,25 +663,36 @@ def main():
     print_step(5, "Setting Up Security Group")
     sg_id = setup_security_group(ec2_client, config['security_group_name'])
     
-    # Step 6: Launch instance
+    # Step 6: Launch instance, packing the upload bundle while it boots
     print_step(6, "Launching EC2 Instance")
-    instance = launch_instance(ec2_resource, config, sg_id)
-    ip_address = instance.public_ip_address
-    
-    # Step 7: Wait for SSH
-    print_step(7, "Waiting for SSH Access")
-    wait_for_ssh(ip_address, key_file)  # Always proceeds after wait
-    
-    # Step 8: Copy files
-    print_step(8, "Copying Files to Instance")
-    if not copy_files_to_instance(ip_address, key_file):
+    executor = ThreadPoolExecutor(max_workers=1)
+    bundle_future = executor.submit(build_bundle, present_files)
+    executor.shutdown(wait=False)
+    # The temp tarball is removed even if launching, SSH or the copy fails (or exits)
+    try:
+        instance = launch_instance(ec2_resource, config, sg_id)
+        ip_address = instance.get('PublicIpAddress')
+        
+        # Step 7: Wait for SSH
+        print_step(7, "Waiting for SSH Access")
+        wait_for_ssh(ip_address, key_file)  # Proceeds even on timeout; the SSH steps retry
+        
+        # Step 8: Copy files
+        print_step(8, "Copying Files to Instance")
+        copied = copy_files_to_instance(ip_address, key_file, bundle_future.result())
+    finally:
+        remove_bundle(bundle_future)
+    if not copied:
+        close_ssh_master(ip_address, key_file)
         print("❌ Deployment failed: File copy error")
         sys.exit(1)
     
-    # Step 9: Install dependencies
-    print_step(9, "Installing Dependencies")
-    if not install_dependencies(ip_address, key_file):
-        print("\n❌ Automatic dependency installation failed.")
+    # Step 9: Install dependencies and start application
+    print_step(9, "Installing Dependencies and Starting Search Engine")
+    deployed = deploy_and_start(ip_address, key_file)
+    close_ssh_master(ip_address, key_file)
+    if not deployed:
+        print("\n❌ Automatic installation/startup failed.")
         print("⚠️  BUT the instance is running and files are copied!")
         print("\n🛠️  MANUAL RECOVERY INSTRUCTIONS:")
         print("   You can finish the deployment manually by running these commands:")
@@ -577,35 +704,19 @@ def main():
         print("      sudo apt update")
         print("      sudo apt install -y python3-pip")
         print("      pip3 install -r requirements.txt")
-        print("      nohup python3 frontend.py > frontend.log 2>&1 &")
-        print(f"\n   3. Test your search engine:")
-        print(f"      http://{ip_address}:{APP_PORT}")
-        print(f"\n   (You can ignore the script failure if you complete these steps manually)")
-        sys.exit(1)
-    
-    # Step 10: Start application
-    print_step(10, "Starting Search Engine Application")
-    if not start_application(ip_address, key_file):
-        print("\n❌ Automatic application startup failed.")
-        print("⚠️  BUT the instance is running and dependencies are installed!")
-        print("\n🛠️  MANUAL RECOVERY INSTRUCTIONS:")
-        print("   You can finish the deployment manually by running these commands:")
-        print(f"\n   1. Connect to the instance:")
-        key_filename = os.path.basename(key_file)
-        print(f"      ssh -i {key_filename} {EC2_USER}@{ip_address}")
-        print(f"\n   2. Start the application:")
         print("      pkill -f frontend.py")
         print("      nohup python3 frontend.py > frontend.log 2>&1 &")
         print(f"\n   3. Test your search engine:")
         print(f"      http://{ip_address}:{APP_PORT}")
+        print(f"\n   (You can ignore the script failure if you complete these steps manually)")
         sys.exit(1)
     
     # Success!
     print_header("DEPLOYMENT SUCCESSFUL!")
-    print(f"Instance ID:  {instance.id}")
+    print(f"Instance ID:  {instance['InstanceId']}")
     print(f"Public IP:    {ip_address}")
-    if instance.public_dns_name:
-        print(f"Public DNS:   {instance.public_dns_name}")
+    if instance.get('PublicDnsName'):
+        print(f"Public DNS:   {instance['PublicDnsName']}")
     print(f"Key Pair:     {unique_key_name}")
     print(f"Key File:     {key_file}")
     print(f"\n🌐 Search Engine URL:")
@@ -618,7 +729,7 @@ def main():
     print(f"\n📝 View Logs:")
     print(f"   ssh -i {key_filename} {EC2_USER}@{ip_address} 'tail -f frontend.log'")
     print(f"\n🛑 To terminate this instance:")
-    print(f"   python aws_terminate.py {instance.id}")
+    print(f"   python aws_terminate.py {instance['InstanceId']}")
     print(f"\n⚠️  IMPORTANT: Save the key file '{key_filename}' to access this instance!")
     print(f"\n{'=' * 70}\n")
 
@@ -1,17 +1,25 @@
 #!/usr/bin/env python3
 """
 AWS Instance Termination Script for ECE326 Lab 4
-Terminates an EC2 instance by instance ID
+Terminates one or more EC2 instances by instance ID
 """
 
-import boto3
 import os
 import sys
-from dotenv import load_dotenv
+from functools import lru_cache
 
 # Configuration
 CREDENTIALS_FILE = 'aws_credentials.env'
 
+# Options for the botocore Config shared by every boto3 client: adaptive retries
+# back off to the real throttling rate, and pooled keep-alive connections are
+# reused across calls and retries
+BOTO_CONFIG_OPTIONS = {
+    'retries': {'max_attempts': 10, 'mode': 'adaptive'},
+    'max_pool_connections': 16,
+    'tcp_keepalive': True,
+}
+
 
 def print_header(message):
     """Print formatted header"""
@@ -20,6 +28,16 @@ def print_header(message):
     print(f"{'=' * 70}\n")
 
 
+def _load_env(path):
+    """Set KEY=value pairs from an env file, keeping variables already in the environment"""
+    with open(path) as f:
+        for line in f:
+            if '=' in line and not line.lstrip().startswith('#'):
+                key, value = line.rstrip().split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip().strip('"\''))
+
+
+@lru_cache(maxsize=None)
 def load_aws_credentials():
     """Load AWS credentials from environment file"""
     if not os.path.exists(CREDENTIALS_FILE):
@@ -30,7 +48,7 @@ def load_aws_credentials():
         print(f"  3. Run this script again")
         sys.exit(1)
     
-    load_dotenv(CREDENTIALS_FILE)
+    _load_env(CREDENTIALS_FILE)
     
     # Validate required credentials
     required_vars = ['AWS_ACCESS_KEY', 'AWS_SECRET_KEY', 'AWS_REGION']
@@ -50,34 +68,36 @@ def load_aws_credentials():
 
 
 def create_ec2_client(config):
-    """Create EC2 client"""
+    """Create EC2 client from a session"""
+    # boto3 is imported here rather than at module level since it takes a
+    # noticeable part of a second to load
+    import boto3
+    from botocore.config import Config
+    
     try:
-        client = boto3.client(
-            'ec2',
-            region_name=config['region'],
+        boto_config = Config(**BOTO_CONFIG_OPTIONS)
+        session = boto3.Session(
             aws_access_key_id=config['access_key'],
-            aws_secret_access_key=config['secret_key']
+            aws_secret_access_key=config['secret_key'],
+            region_name=config['region']
         )
+        client = session.client('ec2', config=boto_config)
         
-        # Test connection
-        client.describe_regions()
-        
+        # No test call: credential errors surface on the terminate call itself
         return client
     except Exception as e:
         print(f"❌ Error connecting to AWS: {e}")
         sys.exit(1)
 
 
-def get_instance_info(client, instance_id):
-    """Get information about an instance"""
+def get_instances_info(client, instance_ids):
+    """Get information about several instances in one call"""
     try:
-        response = client.describe_instances(InstanceIds=[instance_id])
-        
-        if not response['Reservations']:
-            return None
+        response = client.describe_instances(InstanceIds=instance_ids)
         
-        instance = response['Reservations'][0]['Instances'][0]
-        return instance
+        return [instance
+                for reservation in response['Reservations']
+                for instance in reservation['Instances']]
         
     except client.exceptions.ClientError as e:
         if 'InvalidInstanceID.NotFound' in str(e):
@@ -85,13 +105,13 @@ def get_instance_info(client, instance_id):
         raise
 
 
-def terminate_instance(client, instance_id):
-    """Terminate an EC2 instance"""
+def terminate_instances(client, instance_ids):
+    """Terminate EC2 instances in one call"""
     try:
-        response = client.terminate_instances(InstanceIds=[instance_id])
-        return response['TerminatingInstances'][0]
+        response = client.terminate_instances(InstanceIds=instance_ids)
+        return response['TerminatingInstances']
     except Exception as e:
-        print(f"❌ Error terminating instance: {e}")
+        print(f"❌ Error terminating instances: {e}")
         return None
 
 
@@ -100,20 +120,25 @@ def main():
     print_header("ECE326 Lab 4 - AWS Instance Termination")
     
     # Check command line arguments
-    if len(sys.argv) != 2:
-        print("Usage: python aws_terminate.py <instance_id>")
+    args = sys.argv[1:]
+    show_info = '--show-info' in args
+    instance_ids = [arg for arg in args if arg != '--show-info']
+    
+    if not instance_ids:
+        print("Usage: python aws_terminate.py [--show-info] <instance_id> [<instance_id> ...]")
         print("\nExample:")
         print("  python aws_terminate.py i-0ee9470aa16dc1a09")
+        print("\nUse --show-info to display the instance details before confirming.")
         print("\nTo get your instance ID:")
         print("  - Check the output from aws_deploy.py")
         print("  - Or check AWS Console -> EC2 -> Instances")
         sys.exit(1)
     
-    instance_id = sys.argv[1]
-    
     # Validate instance ID format
-    if not instance_id.startswith('i-'):
-        print(f"❌ Error: Invalid instance ID format: {instance_id}")
+    invalid = [instance_id for instance_id in instance_ids if not instance_id.startswith('i-')]
+    if invalid:
+        for instance_id in invalid:
+            print(f"❌ Error: Invalid instance ID format: {instance_id}")
         print(f"Instance IDs should start with 'i-'")
         sys.exit(1)
     
@@ -127,73 +152,75 @@ def main():
     ec2_client = create_ec2_client(config)
     print("✓ Connected to AWS")
     
-    # Get instance information
-    print(f"\nChecking instance: {instance_id}")
-    instance = get_instance_info(ec2_client, instance_id)
-    
-    if instance is None:
-        print(f"❌ Error: Instance {instance_id} not found")
-        print(f"\nPossible reasons:")
-        print(f"  - Instance ID is incorrect")
-        print(f"  - Instance is in a different region (current: {config['region']})")
-        print(f"  - You don't have permission to access this instance")
-        sys.exit(1)
-    
-    # Display instance information
-    state = instance['State']['Name']
-    print(f"\n{'=' * 70}")
-    print(f"Instance Information:")
-    print(f"{'=' * 70}")
-    print(f"Instance ID:    {instance_id}")
-    print(f"Current State:  {state}")
-    
-    if 'PublicIpAddress' in instance:
-        print(f"Public IP:      {instance['PublicIpAddress']}")
-    
-    if 'InstanceType' in instance:
-        print(f"Instance Type:  {instance['InstanceType']}")
-    
-    if 'LaunchTime' in instance:
-        print(f"Launch Time:    {instance['LaunchTime']}")
-    
-    # Check current state
-    if state == 'terminated':
-        print(f"\n⚠️  Instance is already terminated")
-        print(f"{'=' * 70}\n")
-        sys.exit(0)
-    
-    if state == 'terminating':
-        print(f"\n⚠️  Instance is already terminating")
-        print(f"{'=' * 70}\n")
-        sys.exit(0)
+    # Describing the instances costs an extra API call, so only do it on request
+    if show_info:
+        # Get information for all instances at once
+        print(f"\nChecking instances: {', '.join(instance_ids)}")
+        instances = get_instances_info(ec2_client, instance_ids)
+        
+        if instances is None:
+            print(f"❌ Error: Instance not found")
+            print(f"\nPossible reasons:")
+            print(f"  - Instance ID is incorrect")
+            print(f"  - Instance is in a different region (current: {config['region']})")
+            print(f"  - You don't have permission to access this instance")
+            sys.exit(1)
+        
+        # Display instance information
+        for instance in instances:
+            print(f"\n{'=' * 70}")
+            print(f"Instance Information:")
+            print(f"{'=' * 70}")
+            print(f"Instance ID:    {instance['InstanceId']}")
+            print(f"Current State:  {instance['State']['Name']}")
+            
+            if 'PublicIpAddress' in instance:
+                print(f"Public IP:      {instance['PublicIpAddress']}")
+            
+            if 'InstanceType' in instance:
+                print(f"Instance Type:  {instance['InstanceType']}")
+            
+            if 'LaunchTime' in instance:
+                print(f"Launch Time:    {instance['LaunchTime']}")
+        
+        # Check current state
+        if all(instance['State']['Name'] in ('terminated', 'terminating') for instance in instances):
+            print(f"\n⚠️  All instances are already terminated or terminating")
+            print(f"{'=' * 70}\n")
+            sys.exit(0)
     
     # Confirm termination
     print(f"\n{'=' * 70}")
-    print(f"⚠️  WARNING: This will terminate the instance!")
+    print(f"⚠️  WARNING: This will terminate {len(instance_ids)} instance(s)!")
     print(f"{'=' * 70}")
     
-    confirm = input(f"\nAre you sure you want to terminate {instance_id}? (yes/no): ")
+    confirm = input(f"\nAre you sure you want to terminate {', '.join(instance_ids)}? (yes/no): ")
     
     if confirm.lower() not in ['yes', 'y']:
         print(f"\n❌ Termination cancelled")
         sys.exit(0)
     
-    # Terminate instance
-    print(f"\n🛑 Terminating instance {instance_id}...")
-    result = terminate_instance(ec2_client, instance_id)
+    # Terminate all instances in a single call
+    print(f"\n🛑 Terminating {', '.join(instance_ids)}...")
+    results = terminate_instances(ec2_client, instance_ids)
     
-    if result:
-        previous_state = result['PreviousState']['Name']
-        current_state = result['CurrentState']['Name']
-        
+    if results:
         print_header("TERMINATION SUCCESSFUL!")
-        print(f"Instance ID:      {instance_id}")
-        print(f"Previous State:   {previous_state}")
-        print(f"Current State:    {current_state}")
-        print(f"\nThe instance is now terminating and will be fully terminated shortly.")
+        for result in results:
+            previous_state = result['PreviousState']['Name']
+            current_state = result['CurrentState']['Name']
+            
+            print(f"Instance ID:      {result['InstanceId']}")
+            # terminate_instances reports the state it found, so no describe call is needed
+            if previous_state in ('terminated', 'terminating'):
+                print(f"⚠️  Instance was already {previous_state}\n")
+                continue
+            print(f"Previous State:   {previous_state}")
+            print(f"Current State:    {current_state}\n")
+        print(f"Terminated instances will be fully shut down shortly.")
         print(f"\n{'=' * 70}\n")
     else:
-        print(f"\n❌ Failed to terminate instance")
+        print(f"\n❌ Failed to terminate instances")
         sys.exit(1)
 
 
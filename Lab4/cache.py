@@ -6,37 +6,71 @@ Caching significantly improves performance for repeated queries.
 
 Features:
 - LRU eviction policy
+- Admission only on a repeat miss once full, for query results
 - Configurable cache size
 - Cache hit/miss statistics
 - TTL (Time To Live) support for cache entries
 """
 
 import time
-from collections import OrderedDict
-from typing import Any, Optional, Dict
+from collections import OrderedDict, deque
+from typing import Any, Callable, Optional, Dict, Tuple
 import threading
 
+# Coarse monotonic clock in ticks of TICK_SECONDS, refreshed by a daemon thread so
+# cache lookups compare integers instead of calling into the OS clock
+TICK_SECONDS = 0.1
+_NOW = [int(time.monotonic() / TICK_SECONDS)]
+
+
+def _run_clock() -> None:
+    """Keep _NOW[0] current (runs forever in a daemon thread)"""
+    while True:
+        time.sleep(TICK_SECONDS)
+        _NOW[0] = int(time.monotonic() / TICK_SECONDS)
+
+
+threading.Thread(target=_run_clock, name='cache-clock', daemon=True).start()
+
 
 class LRUCache:
     """
     Thread-safe LRU Cache implementation with TTL support
+
+    Reads take no lock: a hit only records the key in an access log, and the
+    log is replayed into the LRU order under the lock on the next write.
     """
 
-    def __init__(self, capacity: int = 1000, ttl: int = 3600):
+    def __init__(self, capacity: int = 1000, ttl: int = 3600,
+                 on_evict: Optional[Callable[[Any], None]] = None):
         """
         Initialize LRU cache
 
         Args:
             capacity: Maximum number of items to cache
             ttl: Time to live for cache entries in seconds (default: 1 hour)
+            on_evict: Called with the key of every entry dropped because it was
+                      least recently used or expired (after the lock is released)
         """
         self.capacity = capacity
         self.ttl = ttl
+        self.on_evict = on_evict
+        self._ttl_ticks = int(ttl / TICK_SECONDS)
+        # key -> (value, tick when stored), kept in LRU order
         self.cache = OrderedDict()
-        self.timestamps = {}
         self.lock = threading.Lock()
 
-        # Statistics
+        # Keys hit since the last write, replayed into the LRU order by put()
+        self._access_log = deque(maxlen=max(capacity, 1))
+        # Most recently used key; hitting it again leaves the order unchanged
+        self._mru = None
+
+        # Bound once here so the lock-free read path skips the attribute lookups
+        self._cache_get = self.cache.get
+        self._log_access = self._access_log.append
+
+        # Statistics. Reads bump the counters without the lock; a racing
+        # increment can be lost, which is acceptable for statistics
         self.hits = 0
         self.misses = 0
         self.evictions = 0
@@ -51,23 +85,41 @@ class LRUCache:
         Returns:
             Cached value if exists and not expired, None otherwise
         """
-        with self.lock:
-            if key not in self.cache:
-                self.misses += 1
-                return None
-
-            # Check if entry has expired
-            if time.time() - self.timestamps[key] > self.ttl:
-                # Entry expired, remove it
-                del self.cache[key]
-                del self.timestamps[key]
-                self.misses += 1
-                return None
-
-            # Move to end (mark as recently used)
-            self.cache.move_to_end(key)
-            self.hits += 1
-            return self.cache[key]
+        entry = self._cache_get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Check if entry has expired
+        value, timestamp = entry
+        if _NOW[0] - timestamp > self._ttl_ticks:
+            # Entry expired, remove it unless a writer refreshed it meanwhile
+            with self.lock:
+                expired = self.cache.get(key) is entry
+                if expired:
+                    del self.cache[key]
+                    if self._mru == key:
+                        self._mru = None
+            if expired and self.on_evict is not None:
+                self.on_evict(key)
+            self.misses += 1
+            return None
+
+        # Mark as recently used; the order itself is updated on the next put
+        if key != self._mru:
+            self._log_access(key)
+            self._mru = key
+        self.hits += 1
+        return value
+
+    def _replay_access_log(self) -> None:
+        """Apply logged hits to the LRU order (caller holds the lock)"""
+        access_log = self._access_log
+        cache = self.cache
+        while access_log:
+            key = access_log.popleft()
+            if key in cache:
+                cache.move_to_end(key)
 
     def put(self, key: str, value: Any) -> None:
         """
@@ -77,7 +129,9 @@ class LRUCache:
             key: Cache key
             value: Value to cache
         """
+        evicted = None
         with self.lock:
+            self._replay_access_log()
             if key in self.cache:
                 # Update existing entry
                 self.cache.move_to_end(key)
@@ -85,19 +139,34 @@ class LRUCache:
                 # Add new entry
                 if len(self.cache) >= self.capacity:
                     # Evict least recently used item
-                    oldest_key = next(iter(self.cache))
-                    del self.cache[oldest_key]
-                    del self.timestamps[oldest_key]
+                    evicted, _ = self.cache.popitem(last=False)
+                    if evicted == self._mru:
+                        self._mru = None
                     self.evictions += 1
 
-            self.cache[key] = value
-            self.timestamps[key] = time.time()
+            self.cache[key] = (value, _NOW[0])
+            self._mru = key
+
+        if evicted is not None and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def delete(self, key: str) -> None:
+        """
+        Remove an entry if present (on_evict is not called)
+
+        Args:
+            key: Cache key
+        """
+        with self.lock:
+            if self.cache.pop(key, None) is not None and self._mru == key:
+                self._mru = None
 
     def clear(self) -> None:
         """Clear all cache entries"""
         with self.lock:
             self.cache.clear()
-            self.timestamps.clear()
+            self._access_log.clear()
+            self._mru = None
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -107,14 +176,15 @@ class LRUCache:
             Dictionary with cache statistics
         """
         with self.lock:
-            total_requests = self.hits + self.misses
-            hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
+            hits, misses = self.hits, self.misses
+            total_requests = hits + misses
+            hit_rate = (hits / total_requests * 100) if total_requests > 0 else 0
 
             return {
                 'capacity': self.capacity,
                 'size': len(self.cache),
-                'hits': self.hits,
-                'misses': self.misses,
+                'hits': hits,
+                'misses': misses,
                 'evictions': self.evictions,
                 'hit_rate': hit_rate,
                 'total_requests': total_requests
@@ -128,11 +198,108 @@ class LRUCache:
             self.evictions = 0
 
 
+# Prefer the compiled backend from _lru_c.pyx when it has been built
+# (cythonize -i -3 _lru_c.pyx); the class above is the pure Python fallback
+try:
+    from _lru_c import LRUCache
+except ImportError:
+    pass
+
+
+class ShardedLRUCache:
+    """
+    LRU cache split into independent shards, each with its own lock
+
+    Keys are routed by hash, so concurrent writers only contend when they hit
+    the same shard. Eviction is LRU within a shard rather than globally.
+    """
+
+    # Small caches keep fewer shards so per-shard LRU stays meaningful
+    MIN_SHARD_CAPACITY = 16
+
+    def __init__(self, capacity: int = 1000, ttl: int = 3600, shards: int = 16,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        """
+        Initialize sharded LRU cache
+
+        Args:
+            capacity: Maximum number of items to cache across all shards
+            ttl: Time to live for cache entries in seconds
+            shards: Maximum number of shards (rounded down to a power of 2)
+            on_evict: Passed to every shard (see LRUCache)
+        """
+        count = 1
+        while count * 2 <= min(shards, capacity // self.MIN_SHARD_CAPACITY):
+            count *= 2
+
+        self.capacity = capacity
+        self.ttl = ttl
+        self.shards = [
+            LRUCache(capacity=capacity // count + (i < capacity % count), ttl=ttl,
+                     on_evict=on_evict)
+            for i in range(count)
+        ]
+        self._mask = count - 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get value from the key's shard (None if missing or expired)"""
+        return self.shards[hash(key) & self._mask].get(key)
+
+    def put(self, key: str, value: Any) -> None:
+        """Put value in the key's shard"""
+        self.shards[hash(key) & self._mask].put(key, value)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from the key's shard if present"""
+        self.shards[hash(key) & self._mask].delete(key)
+
+    def would_evict(self, key: str) -> bool:
+        """Whether putting key now would evict another entry from its shard"""
+        shard = self.shards[hash(key) & self._mask]
+        return key not in shard.cache and len(shard.cache) >= shard.capacity
+
+    def clear(self) -> None:
+        """Clear all shards"""
+        for shard in self.shards:
+            shard.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics summed over all shards
+
+        Returns:
+            Dictionary with cache statistics
+        """
+        stats = {'capacity': self.capacity, 'size': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        for shard in self.shards:
+            shard_stats = shard.get_stats()
+            for name in ('size', 'hits', 'misses', 'evictions'):
+                stats[name] += shard_stats[name]
+
+        total_requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+        stats['total_requests'] = total_requests
+        stats['shards'] = len(self.shards)
+        return stats
+
+    def reset_stats(self) -> None:
+        """Reset statistics counters on all shards"""
+        for shard in self.shards:
+            shard.reset_stats()
+
+
 class QueryCache:
     """
     High-level cache specifically for search queries
+
+    Once the cache is full, results are only admitted on a query's second miss
+    within a window (a TinyLFU-style doorkeeper), so a burst of one-off queries
+    cannot evict the popular ones.
     """
 
+    # Misses remembered by the doorkeeper, per unit of capacity, before it resets
+    DOORKEEPER_WINDOW = 4
+
     def __init__(self, capacity: int = 500, ttl: int = 1800):
         """
         Initialize query cache
@@ -141,9 +308,43 @@ class QueryCache:
             capacity: Maximum number of queries to cache
             ttl: Time to live in seconds (default: 30 minutes)
         """
-        self.cache = LRUCache(capacity=capacity, ttl=ttl)
+        self.cache = ShardedLRUCache(capacity=capacity, ttl=ttl, on_evict=self._forget_key)
+
+        # Cache keys of every page of each normalized query, so invalidate()
+        # touches only that query's entries instead of scanning the cache.
+        # Never held together with a shard lock.
+        self._index_lock = threading.Lock()
+        self._keys_by_query = {}
+        self._query_of_key = {}
+
+        # Keys whose results were turned away once, since the last reset
+        self._doorkeeper = set()
+        self._doorkeeper_size = self.DOORKEEPER_WINDOW * capacity
+
+    def _forget_key(self, key: Tuple[str, int, int]) -> None:
+        """Drop an evicted or expired key from the per-query index"""
+        with self._index_lock:
+            query = self._query_of_key.pop(key, None)
+            if query is None:
+                return
+            keys = self._keys_by_query[query]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_query[query]
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """
+        Canonical form of a query: lowercase words in sorted order, single-spaced
 
-    def _make_key(self, query: str, page: int = 1, per_page: int = 5) -> str:
+        The frontend ranks the lowercased query words against a lowercase
+        index, and the multi-word ranker scores the same documents whatever
+        the word order, so "Cat Hat", "cat  hat" and "hat cat" share one
+        cache entry
+        """
+        return ' '.join(sorted(query.lower().split()))
+
+    def _make_key(self, query: str, page: int = 1, per_page: int = 5) -> Tuple[str, int, int]:
         """
         Create cache key from query parameters
 
@@ -153,11 +354,10 @@ class QueryCache:
             per_page: Results per page
 
         Returns:
-            Cache key string
+            Cache key (normalized query, page, per_page); a tuple hashes in C
+            without formatting a new string, and cannot collide like a digest
         """
-        # Normalize query (lowercase, strip whitespace)
-        normalized_query = query.lower().strip()
-        return f"{normalized_query}:{page}:{per_page}"
+        return (self._normalize_query(query), page, per_page)
 
     def get_results(self, query: str, page: int = 1, per_page: int = 5) -> Optional[Any]:
         """
@@ -178,6 +378,9 @@ class QueryCache:
         """
         Cache search results
 
+        When storing them would evict another entry, results are only kept
+        if the same key was turned away before.
+
         Args:
             query: Search query
             results: Search results to cache
@@ -185,6 +388,19 @@ class QueryCache:
             per_page: Results per page
         """
         key = self._make_key(query, page, per_page)
+
+        # Set operations are atomic under the GIL, and a lost update only
+        # delays an admission, so the doorkeeper needs no lock
+        if key not in self._doorkeeper and self.cache.would_evict(key):
+            if len(self._doorkeeper) >= self._doorkeeper_size:
+                self._doorkeeper.clear()
+            self._doorkeeper.add(key)
+            return
+
+        normalized_query = key[0]
+        with self._index_lock:
+            self._keys_by_query.setdefault(normalized_query, set()).add(key)
+            self._query_of_key[key] = normalized_query
         self.cache.put(key, results)
 
     def invalidate(self, query: Optional[str] = None) -> None:
@@ -195,19 +411,19 @@ class QueryCache:
             query: If provided, invalidate only this query. Otherwise clear all.
         """
         if query is None:
+            with self._index_lock:
+                self._keys_by_query.clear()
+                self._query_of_key.clear()
             self.cache.clear()
         else:
             # Remove all pages for this query
-            normalized_query = query.lower().strip()
-            with self.cache.lock:
-                keys_to_remove = [
-                    k for k in self.cache.cache.keys()
-                    if k.startswith(normalized_query + ":")
-                ]
+            normalized_query = self._normalize_query(query)
+            with self._index_lock:
+                keys_to_remove = self._keys_by_query.pop(normalized_query, ())
                 for key in keys_to_remove:
-                    del self.cache.cache[key]
-                    if key in self.cache.timestamps:
-                        del self.cache.timestamps[key]
+                    del self._query_of_key[key]
+            for key in keys_to_remove:
+                self.cache.delete(key)
 
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
@@ -15,25 +15,25 @@ key_file = "ece326-keypair.pem"
 print(f"Checking instance at {ip}...")
 print("=" * 70)
 
-# Check if frontend is running
-print("\n1. Checking if frontend.py is running:")
-cmd = ['ssh', '-i', key_file, '-o', 'StrictHostKeyChecking=no', 
-       f'ubuntu@{ip}', 'ps aux | grep frontend.py | grep -v grep']
-result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
-print(result.stdout if result.stdout else "❌ Not running")
+# Run the three read-only checks over one SSH connection instead of three.
+# ssh runs this text as `bash -c '<script>'`, so it is on that shell's command
+# line; the anchored pattern only matches the frontend's own `python3 frontend.py`
+checks_script = """
+echo "1. Checking if frontend.py is running:"
+pgrep -af '^python3 frontend\\.py' || echo "❌ Not running"
 
-# Check frontend log
-print("\n2. Frontend log contents:")
-cmd = ['ssh', '-i', key_file, '-o', 'StrictHostKeyChecking=no',
-       f'ubuntu@{ip}', 'cat frontend.log 2>&1 || echo "Log file not found"']
-result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
-print(result.stdout)
+echo
+echo "2. Frontend log contents:"
+cat frontend.log 2>&1 || echo "Log file not found"
 
-# Check if files exist
-print("\n3. Checking if required files exist:")
+echo
+echo "3. Checking if required files exist:"
+ls -la *.py *.db static/ 2>&1
+"""
 cmd = ['ssh', '-i', key_file, '-o', 'StrictHostKeyChecking=no',
-       f'ubuntu@{ip}', 'ls -la *.py *.db static/ 2>&1']
+       f'ubuntu@{ip}', checks_script]
 result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+print()
 print(result.stdout)
 
 # Try to start manually and see error
@@ -7,15 +7,24 @@ This crawler extends the Lab 1 crawler by adding:
 - Link graph construction for PageRank algorithm
 """
 
+import array
 import urllib3
 from urllib.parse import urlparse, urldefrag, urljoin
-from urllib.request import urlopen
 from bs4 import BeautifulSoup, Tag
-from collections import defaultdict
-import re
+from collections import defaultdict, deque
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+import string
 
 from storage import SearchEngineDB
-from pagerank import page_rank, normalize_page_rank
+from pagerank import page_rank_edges, normalize_page_rank
+
+# Parse with libxml2 when lxml is installed; html.parser is the pure Python fallback
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -30,7 +39,30 @@ def attr(elem, attr):
         return ""
 
 
-WORD_SEPARATORS = re.compile(r'\s|\n|\r|\t|[^a-zA-Z0-9\-_]')
+# Pages downloaded concurrently; parsing and indexing stay on the crawl thread
+FETCH_WORKERS = 16
+
+
+def _fetch(http, url, timeout):
+    """Download a page's raw HTML (runs on a worker thread)"""
+    response = http.request('GET', url, timeout=timeout)
+    if response.status >= 400:
+        raise urllib3.exceptions.HTTPError(f"HTTP {response.status}")
+    return response.data
+
+
+class _SeparatorTable(dict):
+    """str.translate table that maps every character outside [a-zA-Z0-9-_]
+    to a space. Characters are looked up lazily and remembered, so non-ASCII
+    text is split the same way as ASCII."""
+
+    def __missing__(self, codepoint):
+        self[codepoint] = ' '
+        return ' '
+
+
+WORD_SEPARATORS = _SeparatorTable(
+    (ord(c), c) for c in string.ascii_letters + string.digits + '-_')
 
 
 class Crawler(object):
@@ -45,10 +77,21 @@ class Crawler(object):
             url_file: Path to file containing seed URLs
         """
         self.db = SearchEngineDB(db_file)
-        self._url_queue = []
-        self._doc_id_cache = {}
-        self._word_id_cache = {}
-        self._link_cache = set()  # Track links already added to avoid duplicates
+        self._url_queue = deque()  # FIFO, so pages are crawled shallowest first
+        # URLs ever queued; pages are parsed in queue order, so the queue stays sorted
+        # by depth and a URL's first sighting is already its shallowest
+        self._queued_urls = set()
+
+        # Keep-alive connections shared by the fetch threads, so pages on the same
+        # host reuse one TCP/TLS connection instead of handshaking every time.
+        # Redirects are followed but failed pages are not retried, as with urlopen
+        self._http = urllib3.PoolManager(num_pools=32, maxsize=FETCH_WORKERS,
+                                         retries=urllib3.Retry(connect=0, read=0, redirect=10))
+
+        # Start from what is already stored so known words and pages never hit the database
+        self._doc_id_cache = self.db.get_doc_ids()
+        self._word_id_cache = self.db.get_word_ids()
+        self._link_cache = set()  # Links already added, packed as (from_doc_id << 32) | to_doc_id
 
         # Functions to call when entering and exiting specific tags
         self._enter = defaultdict(lambda *a, **ka: self._visit_ignore)
@@ -87,31 +130,34 @@ class Crawler(object):
         self._exit['title'] = self._increase_font_factor(-7)
 
         # Never go in and parse these tags
-        self._ignored_tags = {
+        self._ignored_tags = frozenset({
             'meta', 'script', 'link', 'meta', 'embed', 'iframe', 'frame',
             'noscript', 'object', 'svg', 'canvas', 'applet', 'frameset',
             'textarea', 'style', 'area', 'map', 'base', 'basefont', 'param'
-        }
+        })
 
         # Set of words to ignore
-        self._ignored_words = {
+        self._ignored_words = frozenset({
             '', 'the', 'of', 'at', 'on', 'in', 'is', 'it', 'a', 'b', 'c', 'd',
             'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q',
             'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z', 'and', 'or'
-        }
+        })
 
         # Keep track of some info about the page we are currently parsing
         self._curr_depth = 0
         self._curr_url = ""
         self._curr_doc_id = 0
         self._font_size = 0
-        self._curr_words = None
+        # Words of the current page as parallel arrays (word ids, font sizes)
+        self._curr_word_ids = None
+        self._curr_font_sizes = None
+        self._curr_links = None
 
         # Get all URLs into the queue
         try:
             with open(url_file, 'r') as f:
                 for line in f:
-                    self._url_queue.append((self._fix_url(line.strip(), ""), 0))
+                    self._enqueue(self._fix_url(line.strip(), ""), 0)
         except IOError:
             print(f"Warning: Could not open {url_file}")
 
@@ -133,6 +179,12 @@ class Crawler(object):
         self._doc_id_cache[url] = doc_id
         return doc_id
 
+    def _reload_caches(self):
+        """Re-read the id and link caches after a page's transaction was rolled back"""
+        self._doc_id_cache = self.db.get_doc_ids()
+        self._word_id_cache = self.db.get_word_ids()
+        self._link_cache = {(from_id << 32) | to_id for from_id, to_id in self.db.get_links()}
+
     def _fix_url(self, curr_url, rel):
         """Given a url and either something relative to that url or another url,
         get a properly parsed url"""
@@ -146,11 +198,12 @@ class Crawler(object):
         return urljoin(parsed_url.geturl(), rel)
 
     def add_link(self, from_doc_id, to_doc_id):
-        """Add a link into the database"""
-        # Only count the first link between two documents
-        link_key = (from_doc_id, to_doc_id)
+        """Queue a link for the database (written per page by _add_links_to_document)"""
+        # Only count the first link between two documents. The pair is packed into
+        # one int, which is smaller and faster to hash than a tuple (doc ids fit in 32 bits)
+        link_key = (from_doc_id << 32) | to_doc_id
         if link_key not in self._link_cache:
-            self.db.insert_link(from_doc_id, to_doc_id)
+            self._curr_links.append((from_doc_id, to_doc_id))
             self._link_cache.add(link_key)
 
     def _visit_title(self, elem):
@@ -159,22 +212,32 @@ class Crawler(object):
         print(f"  Document title: {title_text[:60]}...")
         self.db.update_document_title(self._curr_doc_id, title_text)
 
+    def _enqueue(self, url, depth):
+        """Queue a URL for crawling unless it has been queued before"""
+        if url not in self._queued_urls:
+            self._queued_urls.add(url)
+            self._url_queue.append((url, depth))
+
     def _visit_a(self, elem):
         """Called when visiting <a> tags"""
         dest_url = self._fix_url(self._curr_url, attr(elem, "href"))
 
         # Add the just found URL to the url queue
-        self._url_queue.append((dest_url, self._curr_depth))
+        self._enqueue(dest_url, self._curr_depth)
 
         # Add a link entry into the database
         self.add_link(self._curr_doc_id, self.document_id(dest_url))
 
     def _add_words_to_document(self):
-        """Add all words in self._curr_words to the database for current document"""
-        print(f"  Number of words: {len(self._curr_words)}")
+        """Add all words of the current page to the database for current document"""
+        print(f"  Number of words: {len(self._curr_word_ids)}")
 
-        for word_id, font_size in self._curr_words:
-            self.db.insert_inverted_index(word_id, self._curr_doc_id, font_size)
+        self.db.insert_inverted_index_many(
+            zip(self._curr_word_ids, repeat(self._curr_doc_id), self._curr_font_sizes))
+
+    def _add_links_to_document(self):
+        """Add all links in self._curr_links to the database in one statement"""
+        self.db.insert_links_many(self._curr_links)
 
     def _increase_font_factor(self, factor):
         """Increase/decrease the current font size"""
@@ -188,66 +251,63 @@ class Crawler(object):
 
     def _add_text(self, elem):
         """Add some text to the document"""
-        words = WORD_SEPARATORS.split(elem.string.lower())
-        for word in words:
-            word = word.strip()
-            if word in self._ignored_words:
+        # Bind per-word lookups to locals; split() already strips whitespace
+        ignored_words = self._ignored_words
+        word_id = self.word_id
+        append_word_id = self._curr_word_ids.append
+        append_font_size = self._curr_font_sizes.append
+        font_size = self._font_size
+
+        for word in elem.string.lower().translate(WORD_SEPARATORS).split():
+            if word in ignored_words:
                 continue
-            self._curr_words.append((self.word_id(word), self._font_size))
+            append_word_id(word_id(word))
+            append_font_size(font_size)
 
     def _text_of(self, elem):
         """Get the text inside some element without any tags"""
         if isinstance(elem, Tag):
-            text = []
-            for sub_elem in elem:
-                text.append(self._text_of(sub_elem))
-            return " ".join(text)
-        else:
-            return elem.string
+            return elem.get_text(separator=" ")
+        return elem.string or ""
 
     def _index_document(self, soup):
         """Traverse the document in depth-first order and call functions when
         entering and leaving tags"""
-
-        class DummyTag(object):
-            next = False
-            name = ''
-
-        class NextTag(object):
-            def __init__(self, obj):
-                self.next = obj
-
-        tag = soup.html
-        stack = [DummyTag(), soup.html]
-
-        while tag and tag.next:
-            tag = tag.next
+        enter = self._enter
+        exit_ = self._exit
+        ignored_tags = self._ignored_tags
+        add_text = self._add_text
+
+        root = soup.html
+        if root is None:
+            return
+
+        # Each stack entry is a tag and the iterator over its children; a tag
+        # is exited once its children run out, so enter/exit always pair up
+        stack = [(root, iter(root.contents))]
+        while stack:
+            tag, children = stack[-1]
+            child = next(children, None)
+
+            if child is None:
+                stack.pop()
+                exit_[tag.name.lower()](tag)
 
             # HTML tag
-            if isinstance(tag, Tag):
-                if tag.parent != stack[-1]:
-                    self._exit[stack[-1].name.lower()](stack[-1])
-                    stack.pop()
-
-                tag_name = tag.name.lower()
+            elif isinstance(child, Tag):
+                tag_name = child.name.lower()
 
                 # Ignore this tag and everything in it
-                if tag_name in self._ignored_tags:
-                    if tag.nextSibling:
-                        tag = NextTag(tag.nextSibling)
-                    else:
-                        self._exit[stack[-1].name.lower()](stack[-1])
-                        stack.pop()
-                        tag = NextTag(tag.parent.nextSibling)
+                if tag_name in ignored_tags:
                     continue
 
                 # Enter the tag
-                self._enter[tag_name](tag)
-                stack.append(tag)
+                enter[tag_name](child)
+                stack.append((child, iter(child.contents)))
 
             # Text (text, cdata, comments, etc.)
             else:
-                self._add_text(tag)
+                add_text(child)
 
     def crawl(self, depth=2, timeout=3):
         """Crawl the web!"""
@@ -256,40 +316,55 @@ class Crawler(object):
         print(f"\nStarting crawl with depth={depth}, timeout={timeout}s")
         print(f"Initial URL queue size: {len(self._url_queue)}\n")
 
-        while len(self._url_queue):
-            url, depth_ = self._url_queue.pop()
-
-            # Skip this url; it's too deep
-            if depth_ > depth:
-                continue
-
-            doc_id = self.document_id(url)
-
-            # We've already seen this document
-            if doc_id in seen:
-                continue
-
-            seen.add(doc_id)
-
-            socket = None
-            try:
-                print(f"Crawling: {url} (depth={depth_})")
-                socket = urlopen(url, timeout=timeout)
-                soup = BeautifulSoup(socket.read(), features="html.parser")
-
-                self._curr_depth = depth_ + 1
-                self._curr_url = url
-                self._curr_doc_id = doc_id
-                self._font_size = 0
-                self._curr_words = []
-                self._index_document(soup)
-                self._add_words_to_document()
-
-            except Exception as e:
-                print(f"  Error: {e}")
-            finally:
-                if socket:
-                    socket.close()
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            while len(self._url_queue):
+                # Take up to FETCH_WORKERS unseen pages off the queue and download them together
+                pending = {}
+                with self.db.bulk():
+                    while len(self._url_queue) and len(pending) < FETCH_WORKERS:
+                        url, depth_ = self._url_queue.popleft()
+
+                        # Skip this url; it's too deep
+                        if depth_ > depth:
+                            continue
+
+                        doc_id = self.document_id(url)
+
+                        # We've already seen this document
+                        if doc_id in seen:
+                            continue
+
+                        seen.add(doc_id)
+                        print(f"Crawling: {url} (depth={depth_})")
+                        pending[executor.submit(_fetch, self._http, url, timeout)] = (url, depth_, doc_id)
+
+                # Parse and index on this thread, which owns the database connection.
+                # Results are taken in submission (queue) order rather than as they
+                # finish, so links found on shallower pages are always queued first
+                for future, (url, depth_, doc_id) in pending.items():
+                    try:
+                        soup = BeautifulSoup(future.result(), features=HTML_PARSER)
+                    except Exception as e:
+                        print(f"  Error ({url}): {e}")
+                        continue
+
+                    # All of a page's writes commit together, or not at all
+                    try:
+                        with self.db.bulk():
+                            self._curr_depth = depth_ + 1
+                            self._curr_url = url
+                            self._curr_doc_id = doc_id
+                            self._font_size = 0
+                            self._curr_word_ids = array.array('i')
+                            self._curr_font_sizes = array.array('i')
+                            self._curr_links = []
+                            self._index_document(soup)
+                            self._add_words_to_document()
+                            self._add_links_to_document()
+
+                    except Exception as e:
+                        print(f"  Error ({url}): {e}")
+                        self._reload_caches()
 
         print(f"\nCrawling completed. Total documents crawled: {len(seen)}")
 
@@ -297,12 +372,12 @@ class Crawler(object):
         """Compute PageRank scores for all documents"""
         print("\nComputing PageRank scores...")
 
-        # Get the link graph from database
-        link_graph = self.db.get_link_graph()
-        print(f"  Link graph size: {len(link_graph)} documents with outgoing links")
+        # Get the links from database
+        links = self.db.get_links()
+        print(f"  Link graph size: {len(links)} links")
 
         # Compute PageRank
-        page_ranks = page_rank(link_graph, num_iterations=num_iterations)
+        page_ranks = page_rank_edges(links, num_iterations=num_iterations)
         print(f"  PageRank computed for {len(page_ranks)} documents")
 
         # Normalize scores
@@ -312,6 +387,9 @@ class Crawler(object):
         self.db.update_page_ranks(page_ranks)
         print("  PageRank scores updated in database")
 
+        # The index is complete, so give the query planner fresh statistics
+        self.db.analyze()
+
         return page_ranks
 
     def print_statistics(self):
@@ -327,7 +405,8 @@ class Crawler(object):
         print("=" * 60)
 
     def close(self):
-        """Close the database connection"""
+        """Close the database connection and any open HTTP connections"""
+        self._http.clear()
         self.db.close()
 
 
@@ -1,15 +1,19 @@
+import gzip
+import hashlib
 import json
 import os
+import re
+import threading
 import time
 from dotenv import load_dotenv
 from beaker.middleware import SessionMiddleware
 import bottle
-from bottle import run, get, post, request, response, route, error, template, static_file, Bottle
+from bottle import run, get, post, request, response, route, error, template, static_file, Bottle, SimpleTemplate
 
 # Import our backend modules
 from storage import SearchEngineDB
 from ranking import AdvancedRanker
-from cache import get_query_cache
+from cache import QueryCache, get_query_cache
 from analytics import get_analytics
 from snippets import get_snippet_generator
 
@@ -17,20 +21,161 @@ from snippets import get_snippet_generator
 DB_FILE = "search_engine.db"
 ANALYTICS_DB_FILE = "analytics.db"
 RESULTS_PER_PAGE = 5
-def get_db():
-    """Get database connection"""
-    return SearchEngineDB(DB_FILE)
+MAX_PAGE = 10000
+
+# Pages within the top MAX_RANKED_RESULTS are cut from a cached ranking
+MAX_RANKED_RESULTS = 1000
+
+# Rendered pages smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+# Seconds between checks for a re-crawled index on the cache hit path
+INDEX_CHECK_INTERVAL = 1.0
 
 PORT = 8080
 
 # Initialize global instances
 query_cache = get_query_cache(capacity=500, ttl=1800)  # Cache 500 queries for 30 mins
+ranking_cache = QueryCache(capacity=100, ttl=1800)  # Un-snippeted top results of 100 queries, shared by their pages
 analytics = get_analytics(ANALYTICS_DB_FILE)
 snippet_gen = get_snippet_generator()
 
+# One database connection and ranker shared by every request. The ranker works
+# through the connection's single cursor, so all use is serialized by db_lock.
+# The crawler can re-index while the frontend runs (the database is in WAL
+# mode), so searches check for a changed index (see check_index)
+db = SearchEngineDB(DB_FILE, check_same_thread=False)
+ranker = AdvancedRanker(db)
+db_lock = threading.Lock()
+
+# Rankings in progress, so that identical searches arriving together share one
+inflight_lock = threading.Lock()
+inflight = {}
+
+index_checked_at = 0.0
+
+def refresh_index():
+    """
+    With db_lock held: once the crawler has changed the index, refresh the
+    ranker's corpus statistics and drop the rankings and result pages cached
+    from the old index
+    """
+    if ranker.refresh():
+        ranking_cache.invalidate()
+        query_cache.invalidate()
+
+def check_index():
+    """
+    refresh_index, at most every INDEX_CHECK_INTERVAL seconds so that cache
+    hits seldom wait for db_lock
+    """
+    global index_checked_at
+    now = time.monotonic()
+    if now - index_checked_at < INDEX_CHECK_INTERVAL:
+        return
+    index_checked_at = now
+    with db_lock:
+        refresh_index()
+
+class InflightRanking:
+    """A ranking being computed, which identical concurrent searches wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def rank_page_once(query_words, offset, limit):
+    """
+    ranker.rank_page, except that a call identical to one already running
+    waits for that call and shares its result (or exception)
+    """
+    key = (tuple(query_words), offset, limit)
+    with inflight_lock:
+        ranking = inflight.get(key)
+        leader = ranking is None
+        if leader:
+            ranking = inflight[key] = InflightRanking()
+
+    if not leader:
+        ranking.done.wait()
+        if ranking.error is not None:
+            raise ranking.error
+        return ranking.result
+
+    try:
+        with db_lock:
+            # Checked here too, so the ranker's own refresh never picks up a
+            # re-crawl without the caches being dropped with it
+            refresh_index()
+            ranking.result = ranker.rank_page(query_words, offset=offset, limit=limit)
+        return ranking.result
+    except Exception as e:
+        ranking.error = e
+        raise
+    finally:
+        with inflight_lock:
+            del inflight[key]
+        ranking.done.set()
+
 # Create app
 app = Bottle()
 
+def results_etag(query, page_urls, total_pages):
+    """
+    ETag for a rendered result page, derived from what the page shows. It is
+    weak because the page also shows the response time and cache status
+    """
+    digest = hashlib.blake2b(repr((query, page_urls, total_pages)).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+class HitPage:
+    """
+    A cached result page as rendered for its first cache hit. Later hits with
+    the same query text resend it, and its gzipped bytes, instead of rendering
+    and compressing it again (so they show that first hit's response time)
+    """
+
+    def __init__(self, query, body):
+        self.query = query
+        self.body = body
+        self.gzipped = None
+
+def accepts_gzip():
+    """
+    Whether the request's Accept-Encoding allows gzip, honouring q-values
+    ("gzip;q=0" refuses it) and the "*" wildcard
+    """
+    qvalues = {}
+    for coding in request.get_header('Accept-Encoding', '').split(','):
+        name, *params = coding.split(';')
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name.strip().lower()] = q
+    return qvalues.get('gzip', qvalues.get('*', 0.0)) > 0
+
+def compress_page(body, hit_page=None):
+    """
+    Gzip a rendered page when the client accepts it and it is big enough to
+    benefit; result pages are repetitive markup and shrink several times over.
+    The gzipped bytes of a HitPage are kept with it and reused
+    """
+    response.set_header('Vary', 'Accept-Encoding')
+    if len(body) < GZIP_MIN_BYTES or not accepts_gzip():
+        return body
+    response.set_header('Content-Encoding', 'gzip')
+    if hit_page is None:
+        return gzip.compress(body.encode(), compresslevel=6)
+    if hit_page.gzipped is None:
+        hit_page.gzipped = gzip.compress(body.encode(), compresslevel=6)
+    return hit_page.gzipped
+
 # Session settings
 session_opts = {
     'session.type': 'file',
@@ -40,15 +185,20 @@ session_opts = {
 }
 appWithSessions = SessionMiddleware(app, session_opts)
 
+# Templates are parsed once at startup instead of on the request path
+INDEX_TEMPLATE = SimpleTemplate(name='static/index.tpl', lookup=['./'])
+RESULTS_TEMPLATE = SimpleTemplate(name='static/resultPage.tpl', lookup=['./'])
+ANALYTICS_TEMPLATE = SimpleTemplate(name='static/analytics.tpl', lookup=['./'])
+
 # Query screen for homepage
 @app.route('/')
 def home():
 
     # Get database statistics
     try:
-        with get_db() as db:
+        with db_lock:
             stats = db.get_statistics()
-            stats_html = f"""
+        stats_html = f"""
             <div class="stats">
                 <h3>Index Statistics</h3>
                 <p>Total documents: {stats['total_documents']}</p>
@@ -59,7 +209,7 @@ def home():
     except Exception as e:
         stats_html = f'<div class="info"><p style="color: red;">Database not found. Please run the crawler first.</p></div>'
 
-    return bottle.template('static/index.tpl', STATS=stats_html)
+    return INDEX_TEMPLATE.render(STATS=stats_html)
 
 # Result page for query
 @app.route("/search")
@@ -75,61 +225,76 @@ def process_query():
     query = request.query.keywords or ""
     query = query.strip()
 
-    # Get the current page number (default is 1)
-    page = int(request.query.page or 1)
+    # Get the current page number (default is 1, also used for anything but a short number; large pages are capped)
+    page_param = request.query.page
+    page = min(max(int(page_param), 1), MAX_PAGE) if page_param.isdecimal() and len(page_param) < 6 else 1
     per_page = RESULTS_PER_PAGE
 
-    # Check cache first
+    # Check cache first, unless the index has changed under it
+    check_index()
     cached_results = query_cache.get_results(query, page, per_page)
 
     # Cache hit - grab cached results
     if cached_results is not None:
         
-        urls, total_pages, cache_hit = cached_results
+        urls, total_pages, etag, hit_pages = cached_results
         response_time_ms = (time.time() - start_time) * 1000
 
         # Log to analytics
-        analytics.log_query(query, len(urls) * total_pages, response_time_ms, user_ip=request.remote_addr)
-
-        return template('static/resultPage.tpl',
-                        urls=urls,
-                        query=query,
-                        page=page,
-                        total_pages=total_pages,
-                        cache_hit=True,
-                        response_time=f"{response_time_ms:.2f}ms")
+        analytics.log_query_async(query, len(urls) * total_pages, response_time_ms, user_ip=request.remote_addr)
+
+        # The browser already has this page, skip rendering and sending it
+        if request.get_header('If-None-Match') == etag:
+            response.status = 304
+            return ''
+        response.set_header('ETag', etag)
+
+        # Render only the first hit for this query text (the cache key folds case)
+        hit_page = hit_pages[0]
+        if hit_page is None or hit_page.query != query:
+            hit_page = hit_pages[0] = HitPage(query, RESULTS_TEMPLATE.render(urls=urls,
+                                                                            query=query,
+                                                                            page=page,
+                                                                            total_pages=total_pages,
+                                                                            cache_hit=True,
+                                                                            response_time=f"{response_time_ms:.2f}ms"))
+        return compress_page(hit_page.body, hit_page)
 
     # Cache miss - perform search
     try:
-        with get_db() as db:
-            # Use advanced ranking system
-            ranker = AdvancedRanker(db)
-
-            # Split query into words for multi-word search
-            query_words = query.split()
-
-            if not query_words:
-                urls = []
-            elif len(query_words) == 1:
-                # Single word search
-                urls = ranker.rank_single_word(query_words[0], limit=1000)
-            else:
-                # Multi-word search
-                urls = ranker.rank_multi_word(query_words, limit=1000)
-
-            # Generate snippets for results, we use the title as a simple snippet
-            enhanced_urls = []
-
-            for url, title, score, pagerank in urls:
-                # Generate a simple snippet (in production, use actual page content)
-                snippet = title or "No description available"
-
-                # Highlight query words in snippet
-                for word in query_words:
-                    snippet = snippet.replace(word, f"<b>{word}</b>")
-                    snippet = snippet.replace(word.capitalize(), f"<b>{word.capitalize()}</b>")
-
-                enhanced_urls.append((url, title, score, pagerank, snippet))
+        # Split query into words for multi-word search, lowercased like the
+        # crawler's index (and like the query cache key)
+        query_words = query.lower().split()
+
+        # Use advanced ranking system
+        start = (page - 1) * per_page
+        if start + per_page <= MAX_RANKED_RESULTS:
+            # Cut the page from the query's ranking, ranking it once for all its pages
+            ranking = ranking_cache.get_results(query)
+            if ranking is None:
+                ranking = rank_page_once(query_words, 0, MAX_RANKED_RESULTS)
+                ranking_cache.cache_results(query, ranking)
+            num_results, ranked_urls = ranking
+            urls = ranked_urls[start:start + per_page]
+        else:
+            num_results, urls = rank_page_once(query_words, start, per_page)
+
+        # Generate snippets for this page only, we use the title as a simple snippet
+        page_urls = []
+
+        # One compiled pattern highlights every query word, in any case, in a single pass
+        highlight_re = re.compile(r'(?<!\w)(' + '|'.join(map(re.escape, query_words)) + r')(?!\w)',
+                                  re.IGNORECASE) if query_words else None
+
+        for url, title, score, pagerank in urls:
+            # Generate a simple snippet (in production, use actual page content)
+            snippet = title or "No description available"
+
+            # Highlight query words in snippet
+            if highlight_re is not None:
+                snippet = highlight_re.sub(r'<b>\1</b>', snippet)
+
+            page_urls.append((url, title, score, pagerank, snippet))
 
     except Exception as e:
         return f"<body style=\"text-align: center;\"><h1>Error: {e}</h1><a href=\"/\">Return to EUREKA! Homepage</a></body>"
@@ -138,24 +303,21 @@ def process_query():
     response_time_ms = (time.time() - start_time) * 1000
 
     # Log to analytics
-    analytics.log_query(query, len(enhanced_urls), response_time_ms, user_ip=request.remote_addr)
+    analytics.log_query_async(query, num_results, response_time_ms, user_ip=request.remote_addr)
 
-    # Paginate results
-    start = (page - 1) * per_page
-    end = start + per_page
-    page_urls = enhanced_urls[start:end]
-    total_pages = (len(enhanced_urls) + per_page - 1) // per_page or 1
+    total_pages = (num_results + per_page - 1) // per_page or 1
 
-    # Cache the results
-    query_cache.cache_results(query, (page_urls, total_pages, False), page, per_page)
+    # Cache the results, with a slot for the page rendered on the first hit
+    etag = results_etag(query, page_urls, total_pages)
+    query_cache.cache_results(query, (page_urls, total_pages, etag, [None]), page, per_page)
+    response.set_header('ETag', etag)
 
-    return template('static/resultPage.tpl',
-                    urls=page_urls,
-                    query=query,
-                    page=page,
-                    total_pages=total_pages,
-                    cache_hit=False,
-                    response_time=f"{response_time_ms:.2f}ms")
+    return compress_page(RESULTS_TEMPLATE.render(urls=page_urls,
+                                                 query=query,
+                                                 page=page,
+                                                 total_pages=total_pages,
+                                                 cache_hit=False,
+                                                 response_time=f"{response_time_ms:.2f}ms"))
 
 # Analytics dashboard page
 @app.route('/analytics')
@@ -173,11 +335,10 @@ def show_analytics():
     # Get cache stats
     cache_stats = query_cache.get_stats()
 
-    return template('static/analytics.tpl',
-                    popular=popular,
-                    recent=recent,
-                    performance=perf,
-                    cache_stats=cache_stats)
+    return compress_page(ANALYTICS_TEMPLATE.render(popular=popular,
+                                                   recent=recent,
+                                                   performance=perf,
+                                                   cache_stats=cache_stats))
 
 # Serving static files
 @app.route('/static/<filename>')
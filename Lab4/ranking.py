@@ -11,10 +11,29 @@ This module implements a sophisticated ranking algorithm that combines:
 This provides much better search results than simple PageRank-only ranking.
 """
 
+import heapq
 import math
-from typing import List, Dict, Tuple, Set
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Tuple, Set, Optional
 from collections import defaultdict
 
+# Document ids bound per IN (...) list, well under SQLite's variable limit
+IN_BATCH_SIZE = 500
+
+# Entries kept by each of the ranker's memo tables
+MEMO_SIZE = 100000
+
+
+def _page_of(results: List[Tuple[str, str, float, float]], offset: int, limit: int) -> List[Tuple[str, str, float, float]]:
+    """
+    Select results offset..offset+limit-1 in descending combined_score order
+
+    heapq.nlargest keeps only offset+limit candidates instead of sorting every
+    result, and orders ties like a stable sort would
+    """
+    return heapq.nlargest(offset + limit, results, key=itemgetter(2))[offset:]
+
 
 class AdvancedRanker:
     """
@@ -30,6 +49,15 @@ class AdvancedRanker:
         """
         self.db = db
         self.total_docs = self._get_total_documents()
+        self._data_version = self._get_data_version()
+
+        # Word ids, document frequencies and document lengths only change when
+        # the index is updated, so they are memoized until it is (see refresh).
+        # Words not in the index yet are not remembered, so they are found as
+        # soon as the crawler adds them
+        self._word_ids = {}
+        self._get_doc_frequency = lru_cache(maxsize=MEMO_SIZE)(self._count_doc_frequency)
+        self._get_doc_length = lru_cache(maxsize=MEMO_SIZE)(self._count_doc_length)
 
         # Weighting factors for different ranking signals
         self.weights = {
@@ -39,6 +67,48 @@ class AdvancedRanker:
             'font_size': 0.1      # Font size bonus weight
         }
 
+    def clear_caches(self):
+        """Forget memoized index statistics; call after the index is updated"""
+        self._word_ids.clear()
+        self._get_doc_frequency.cache_clear()
+        self._get_doc_length.cache_clear()
+        self.total_docs = self._get_total_documents()
+        self._data_version = self._get_data_version()
+
+    def refresh(self) -> bool:
+        """
+        Clear the memoized index statistics if another connection (such as the
+        crawler's) has committed to the database since they were gathered
+
+        Every ranking call checks this first, so a long-lived ranker follows a
+        re-crawled index. Changes made through this ranker's own connection
+        still need clear_caches()
+
+        Returns:
+            True if the caches were cleared
+        """
+        if self._get_data_version() == self._data_version:
+            return False
+        self.clear_caches()
+        return True
+
+    def _get_data_version(self) -> int:
+        """SQLite's data_version, which changes when another connection commits"""
+        cursor = self.db.cursor
+        cursor.execute('PRAGMA data_version')
+        return cursor.fetchone()[0]
+
+    def _get_word_id(self, word: str) -> Optional[int]:
+        """db.get_word_id, memoized only for words that are in the index"""
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self.db.get_word_id(word)
+            if word_id is not None:
+                if len(self._word_ids) >= MEMO_SIZE:
+                    self._word_ids.clear()
+                self._word_ids[word] = word_id
+        return word_id
+
     def _get_total_documents(self) -> int:
         """Get total number of documents in the database"""
         cursor = self.db.cursor
@@ -58,22 +128,29 @@ class AdvancedRanker:
         Returns:
             IDF score
         """
-        cursor = self.db.cursor
-
         # Get word_id
-        word_id = self.db.get_word_id(word)
+        word_id = self._get_word_id(word)
         if not word_id:
             return 0.0
 
-        # Count documents containing this word
+        return self._idf_from_frequency(self._get_doc_frequency(word_id))
+
+    def _count_doc_frequency(self, word_id: int) -> int:
+        """Count documents containing a word (memoized as _get_doc_frequency)"""
+        cursor = self.db.cursor
+
+        # (word_id, doc_id) is the primary key, so every matching row is
+        # already a distinct document
         cursor.execute('''
-            SELECT COUNT(DISTINCT doc_id)
+            SELECT COUNT(*)
             FROM InvertedIndex
             WHERE word_id = ?
         ''', (word_id,))
 
-        doc_freq = cursor.fetchone()[0]
+        return cursor.fetchone()[0]
 
+    def _idf_from_frequency(self, doc_freq: int) -> float:
+        """IDF of a word found in doc_freq documents (see _calculate_idf)"""
         if doc_freq == 0:
             return 0.0
 
@@ -94,17 +171,9 @@ class AdvancedRanker:
         Returns:
             TF score
         """
-        cursor = self.db.cursor
-
         # For now, we use a normalized count (since we only store once per doc)
         # In a full implementation, you'd count actual occurrences
-        cursor.execute('''
-            SELECT COUNT(*)
-            FROM InvertedIndex
-            WHERE doc_id = ?
-        ''', (doc_id,))
-
-        total_words = cursor.fetchone()[0]
+        total_words = self._get_doc_length(doc_id)
 
         if total_words == 0:
             return 0.0
@@ -112,6 +181,18 @@ class AdvancedRanker:
         # Simple TF: 1 / total unique words in document
         return 1.0 / (total_words + 1)
 
+    def _count_doc_length(self, doc_id: int) -> int:
+        """Count distinct words in a document (memoized as _get_doc_length)"""
+        cursor = self.db.cursor
+
+        cursor.execute('''
+            SELECT COUNT(*)
+            FROM InvertedIndex
+            WHERE doc_id = ?
+        ''', (doc_id,))
+
+        return cursor.fetchone()[0]
+
     def _get_font_size_score(self, word_id: int, doc_id: int) -> float:
         """
         Get font size score for a word in a document
@@ -168,22 +249,53 @@ class AdvancedRanker:
         title = result[0].lower()
         return word.lower() in title
 
-    def rank_single_word(self, word: str, limit: int = 100) -> List[Tuple[str, str, float, float]]:
+    def rank_page(self, words: List[str], offset: int = 0, limit: int = 10) -> Tuple[int, List[Tuple[str, str, float, float]]]:
+        """
+        Rank documents for a query and return one page of the results
+
+        Args:
+            words: List of search words
+            offset: Number of top results to skip
+            limit: Maximum number of results on the page
+
+        Returns:
+            Tuple of (total number of matching documents, page), where the
+            page is a list of (url, title, combined_score, page_rank) tuples
+            sorted by combined_score in descending order
+        """
+        if not words:
+            return 0, []
+
+        self.refresh()
+        if len(words) == 1:
+            results = self._score_single_word(words[0])
+        else:
+            results = self._score_multi_word(words)
+
+        return len(results), _page_of(results, offset, limit)
+
+    def rank_single_word(self, word: str, limit: int = 100, offset: int = 0) -> List[Tuple[str, str, float, float]]:
         """
         Rank documents for a single word query using advanced ranking
 
         Args:
             word: The search word
             limit: Maximum number of results
+            offset: Number of top results to skip
 
         Returns:
             List of tuples: (url, title, combined_score, page_rank)
             Sorted by combined_score in descending order
         """
+        self.refresh()
+        return _page_of(self._score_single_word(word), offset, limit)
+
+    def _score_single_word(self, word: str) -> List[Tuple[str, str, float, float]]:
+        """Score every document containing word, in no particular order"""
         cursor = self.db.cursor
 
         # Get word_id
-        word_id = self.db.get_word_id(word)
+        word_id = self._get_word_id(word)
         if not word_id:
             return []
 
@@ -226,12 +338,9 @@ class AdvancedRanker:
 
             results.append((url, title, combined_score, page_rank))
 
-        # Sort by combined score (descending)
-        results.sort(key=lambda x: x[2], reverse=True)
+        return results
 
-        return results[:limit]
-
-    def rank_multi_word(self, words: List[str], limit: int = 100) -> List[Tuple[str, str, float, float]]:
+    def rank_multi_word(self, words: List[str], limit: int = 100, offset: int = 0) -> List[Tuple[str, str, float, float]]:
         """
         Rank documents for multi-word queries
 
@@ -240,6 +349,7 @@ class AdvancedRanker:
         Args:
             words: List of search words
             limit: Maximum number of results
+            offset: Number of top results to skip
 
         Returns:
             List of tuples: (url, title, combined_score, page_rank)
@@ -249,64 +359,125 @@ class AdvancedRanker:
             return []
 
         if len(words) == 1:
-            return self.rank_single_word(words[0], limit)
+            return self.rank_single_word(words[0], limit, offset)
+
+        self.refresh()
+        return _page_of(self._score_multi_word(words), offset, limit)
 
+    def _score_multi_word(self, words: List[str]) -> List[Tuple[str, str, float, float]]:
+        """Score the documents matching a multi-word query, in no particular order"""
         cursor = self.db.cursor
 
-        # Get word_ids for all words
+        # Get word_ids for all words, their document frequencies and IDFs,
+        # and the first query word for each id
         word_ids = []
+        doc_freqs = {}
         idfs = {}
+        word_by_id = {}
 
         for word in words:
-            word_id = self.db.get_word_id(word)
+            word_id = self._get_word_id(word)
             if word_id:
                 word_ids.append(word_id)
-                idfs[word_id] = self._calculate_idf(word)
+                if word_id not in doc_freqs:
+                    doc_freqs[word_id] = self._get_doc_frequency(word_id)
+                    idfs[word_id] = self._idf_from_frequency(doc_freqs[word_id])
+                word_by_id.setdefault(word_id, word.lower())
 
         if not word_ids:
             return []
 
-        # Find documents containing ALL words (intersection)
-        # Build a query that finds documents with all word_ids
-        placeholders = ','.join(['?'] * len(word_ids))
+        # Find documents containing ALL words (intersection), starting from
+        # the rarest word's postings and keeping only the candidates each
+        # next rarest word also has, stopping as soon as none are left
+        distinct_word_ids = sorted(doc_freqs, key=doc_freqs.get)
+        word_placeholders = ','.join(['?'] * len(distinct_word_ids))
 
-        cursor.execute(f'''
+        cursor.execute('''
             SELECT doc_id
             FROM InvertedIndex
-            WHERE word_id IN ({placeholders})
-            GROUP BY doc_id
-            HAVING COUNT(DISTINCT word_id) = ?
-        ''', word_ids + [len(word_ids)])
+            WHERE word_id = ?
+            ORDER BY doc_id
+        ''', (distinct_word_ids[0],))
 
         matching_doc_ids = [row[0] for row in cursor.fetchall()]
 
+        for word_id in distinct_word_ids[1:]:
+            if not matching_doc_ids:
+                break
+
+            remaining_doc_ids = []
+            for i in range(0, len(matching_doc_ids), IN_BATCH_SIZE):
+                batch = matching_doc_ids[i:i + IN_BATCH_SIZE]
+                doc_placeholders = ','.join(['?'] * len(batch))
+                cursor.execute(f'''
+                    SELECT doc_id
+                    FROM InvertedIndex
+                    WHERE word_id = ? AND doc_id IN ({doc_placeholders})
+                    ORDER BY doc_id
+                ''', [word_id] + batch)
+                remaining_doc_ids.extend(row[0] for row in cursor.fetchall())
+
+            matching_doc_ids = remaining_doc_ids
+
         if not matching_doc_ids:
             # If no documents contain all words, fall back to OR search
             # Get documents containing ANY of the words
             cursor.execute(f'''
                 SELECT DISTINCT doc_id
                 FROM InvertedIndex
-                WHERE word_id IN ({placeholders})
-            ''', word_ids)
+                WHERE word_id IN ({word_placeholders})
+            ''', distinct_word_ids)
 
             matching_doc_ids = [row[0] for row in cursor.fetchall()]
 
+        # Fetch document info, the query words' font sizes and document
+        # lengths for all matching documents in a few batched queries
+        doc_info = {}
+        font_sizes = defaultdict(dict)
+        doc_lengths = {}
+
+        for i in range(0, len(matching_doc_ids), IN_BATCH_SIZE):
+            batch = matching_doc_ids[i:i + IN_BATCH_SIZE]
+            doc_placeholders = ','.join(['?'] * len(batch))
+
+            cursor.execute(f'''
+                SELECT doc_id, url, title, page_rank
+                FROM DocumentIndex
+                WHERE doc_id IN ({doc_placeholders})
+            ''', batch)
+            for doc_id, url, title, page_rank in cursor.fetchall():
+                doc_info[doc_id] = (url, title, page_rank)
+
+            cursor.execute(f'''
+                SELECT doc_id, word_id, font_size
+                FROM InvertedIndex
+                WHERE doc_id IN ({doc_placeholders}) AND word_id IN ({word_placeholders})
+            ''', batch + distinct_word_ids)
+            for doc_id, word_id, font_size in cursor.fetchall():
+                font_sizes[doc_id][word_id] = font_size
+
+            cursor.execute(f'''
+                SELECT doc_id, COUNT(*)
+                FROM InvertedIndex
+                WHERE doc_id IN ({doc_placeholders})
+                GROUP BY doc_id
+            ''', batch)
+            doc_lengths.update(cursor.fetchall())
+
         # Score each matching document
         results = []
 
         for doc_id in matching_doc_ids:
-            # Get document info
-            cursor.execute('''
-                SELECT url, title, page_rank
-                FROM DocumentIndex
-                WHERE doc_id = ?
-            ''', (doc_id,))
-
-            doc_info = cursor.fetchone()
-            if not doc_info:
+            if doc_id not in doc_info:
                 continue
 
-            url, title, page_rank = doc_info
+            url, title, page_rank = doc_info[doc_id]
+            doc_font_sizes = font_sizes[doc_id]
+            lower_title = title.lower() if title else None
+
+            # Simple TF: 1 / total unique words in document (see _calculate_tf)
+            tf = 1.0 / (doc_lengths.get(doc_id, 0) + 1)
 
             # Calculate aggregate score across all query words
             total_tfidf = 0.0
@@ -315,29 +486,15 @@ class AdvancedRanker:
 
             for word_id in word_ids:
                 # Check if this document contains this word
-                cursor.execute('''
-                    SELECT 1 FROM InvertedIndex
-                    WHERE word_id = ? AND doc_id = ?
-                ''', (word_id, doc_id))
-
-                if cursor.fetchone():
-                    # Calculate TF
-                    tf = self._calculate_tf(word_id, doc_id)
-
+                if word_id in doc_font_sizes:
                     # Add to TF-IDF sum
                     total_tfidf += tf * idfs[word_id]
 
-                    # Add font size score
-                    total_font_score += self._get_font_size_score(word_id, doc_id)
+                    # Add font size score (see _get_font_size_score)
+                    total_font_score += min(doc_font_sizes[word_id] / 7.0, 1.0)
 
-                    # Check title match
-                    word = None
-                    for w in words:
-                        if self.db.get_word_id(w) == word_id:
-                            word = w
-                            break
-
-                    if word and self._check_title_match(word, doc_id):
+                    # Check title match (see _check_title_match)
+                    if lower_title and word_by_id[word_id] in lower_title:
                         title_matches += 1
 
             # Average the scores
@@ -358,10 +515,7 @@ class AdvancedRanker:
 
             results.append((url, title, combined_score, page_rank))
 
-        # Sort by combined score (descending)
-        results.sort(key=lambda x: x[2], reverse=True)
-
-        return results[:limit]
+        return results
 
 
 if __name__ == "__main__":
@@ -11,24 +11,42 @@ using SQLite database. It stores:
 
 import sqlite3
 import json
-from typing import Dict, List, Tuple, Set, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple, Set, Optional
 
 
 class SearchEngineDB:
     """Database interface for search engine persistent storage"""
 
-    def __init__(self, db_file='search_engine.db'):
+    def __init__(self, db_file='search_engine.db', check_same_thread=True):
         """
         Initialize database connection and create tables if they don't exist
 
         Args:
             db_file: Path to SQLite database file
+            check_same_thread: Passed to sqlite3.connect; set to False to share
+                               the connection between threads (callers must
+                               then serialize access themselves)
         """
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file)
+        self.conn = sqlite3.connect(db_file, check_same_thread=check_same_thread)
         self.cursor = self.conn.cursor()
+        self._in_bulk = False
+        self._configure()
         self._create_tables()
 
+    def _configure(self):
+        """Tune SQLite PRAGMAs for crawl-time bulk writes"""
+        # WAL lets the frontend keep reading while the crawler writes, and
+        # synchronous=NORMAL only syncs at checkpoints instead of every commit
+        if self.db_file != ':memory:':
+            self.cursor.executescript('''
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+            ''')
+
+        self.cursor.execute('PRAGMA temp_store = MEMORY')
+
     def _create_tables(self):
         """Create database tables if they don't exist"""
 
@@ -78,14 +96,22 @@ class SearchEngineDB:
             CREATE INDEX IF NOT EXISTS idx_lexicon_word ON Lexicon(word)
         ''')
 
+        # Covering index for lookups by word: posting lists, document
+        # frequencies and font sizes are all read from the index alone
         self.cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_inverted_word ON InvertedIndex(word_id)
+            CREATE INDEX IF NOT EXISTS idx_ii_wid_did_fs ON InvertedIndex(word_id, doc_id, font_size)
         ''')
 
+        # Lookups by document: document lengths, and a document's postings
+        # for a given set of words
         self.cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_inverted_doc ON InvertedIndex(doc_id)
+            CREATE INDEX IF NOT EXISTS idx_ii_did_wid ON InvertedIndex(doc_id, word_id)
         ''')
 
+        # Superseded by the two indexes above
+        self.cursor.execute('DROP INDEX IF EXISTS idx_inverted_word')
+        self.cursor.execute('DROP INDEX IF EXISTS idx_inverted_doc')
+
         self.cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_link_from ON LinkGraph(from_doc_id)
         ''')
@@ -96,6 +122,37 @@ class SearchEngineDB:
 
         self.conn.commit()
 
+    def _commit(self):
+        """Commit the current transaction unless a bulk() block is open"""
+        if not self._in_bulk:
+            self.conn.commit()
+
+    @contextmanager
+    def bulk(self):
+        """
+        Group many inserts into a single transaction
+
+        Inside the block the insert_* methods skip their per-row commits;
+        everything is committed once on exit, or rolled back on error.
+
+        Example:
+            with db.bulk():
+                for word in words:
+                    db.insert_word(word)
+        """
+        self.conn.commit()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        self._in_bulk = True
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._in_bulk = False
+
     def insert_word(self, word: str) -> int:
         """
         Insert a word into the lexicon and return its word_id
@@ -108,7 +165,7 @@ class SearchEngineDB:
         """
         try:
             self.cursor.execute('INSERT INTO Lexicon (word) VALUES (?)', (word,))
-            self.conn.commit()
+            self._commit()
             return self.cursor.lastrowid
         except sqlite3.IntegrityError:
             # Word already exists, get its ID
@@ -129,7 +186,7 @@ class SearchEngineDB:
         try:
             self.cursor.execute('INSERT INTO DocumentIndex (url, title) VALUES (?, ?)',
                                 (url, title))
-            self.conn.commit()
+            self._commit()
             return self.cursor.lastrowid
         except sqlite3.IntegrityError:
             # Document already exists, get its ID
@@ -140,7 +197,7 @@ class SearchEngineDB:
         """Update the title of a document"""
         self.cursor.execute('UPDATE DocumentIndex SET title = ? WHERE doc_id = ?',
                             (title, doc_id))
-        self.conn.commit()
+        self._commit()
 
     def insert_inverted_index(self, word_id: int, doc_id: int, font_size: int):
         """
@@ -156,14 +213,29 @@ class SearchEngineDB:
                 INSERT INTO InvertedIndex (word_id, doc_id, font_size)
                 VALUES (?, ?, ?)
             ''', (word_id, doc_id, font_size))
-            self.conn.commit()
+            self._commit()
         except sqlite3.IntegrityError:
             # Entry already exists, update font_size
             self.cursor.execute('''
                 UPDATE InvertedIndex SET font_size = ?
                 WHERE word_id = ? AND doc_id = ?
             ''', (font_size, word_id, doc_id))
-            self.conn.commit()
+            self._commit()
+
+    def insert_inverted_index_many(self, rows: Iterable[Tuple[int, int, int]]):
+        """
+        Insert many inverted index entries with a single statement
+
+        Args:
+            rows: Iterable of (word_id, doc_id, font_size) tuples; for repeated
+                  (word_id, doc_id) pairs the last font_size wins
+        """
+        self.cursor.executemany('''
+            INSERT INTO InvertedIndex (word_id, doc_id, font_size)
+            VALUES (?, ?, ?)
+            ON CONFLICT(word_id, doc_id) DO UPDATE SET font_size = excluded.font_size
+        ''', rows)
+        self._commit()
 
     def insert_link(self, from_doc_id: int, to_doc_id: int):
         """
@@ -178,11 +250,24 @@ class SearchEngineDB:
                 INSERT INTO LinkGraph (from_doc_id, to_doc_id)
                 VALUES (?, ?)
             ''', (from_doc_id, to_doc_id))
-            self.conn.commit()
+            self._commit()
         except sqlite3.IntegrityError:
             # Link already exists, ignore
             pass
 
+    def insert_links_many(self, rows: List[Tuple[int, int]]):
+        """
+        Insert many links with a single statement, ignoring existing ones
+
+        Args:
+            rows: List of (from_doc_id, to_doc_id) tuples
+        """
+        self.cursor.executemany('''
+            INSERT OR IGNORE INTO LinkGraph (from_doc_id, to_doc_id)
+            VALUES (?, ?)
+        ''', rows)
+        self._commit()
+
     def get_word_id(self, word: str) -> Optional[int]:
         """Get the word_id for a given word"""
         self.cursor.execute('SELECT word_id FROM Lexicon WHERE word = ?', (word,))
@@ -195,6 +280,16 @@ class SearchEngineDB:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    def get_word_ids(self) -> Dict[str, int]:
+        """Get the whole lexicon as a word -> word_id dictionary"""
+        self.cursor.execute('SELECT word, word_id FROM Lexicon')
+        return dict(self.cursor.fetchall())
+
+    def get_doc_ids(self) -> Dict[str, int]:
+        """Get every document as a url -> doc_id dictionary"""
+        self.cursor.execute('SELECT url, doc_id FROM DocumentIndex')
+        return dict(self.cursor.fetchall())
+
     def search_word(self, word: str, limit: int = 100) -> List[Tuple[str, str, float]]:
         """
         Search for documents containing a word, sorted by PageRank
@@ -232,6 +327,16 @@ class SearchEngineDB:
             links[from_id].append(to_id)
         return links
 
+    def get_links(self) -> List[Tuple[int, int]]:
+        """
+        Get every link as a flat list, the cheapest input for page_rank_edges
+
+        Returns:
+            List of tuples: (from_doc_id, to_doc_id)
+        """
+        self.cursor.execute('SELECT from_doc_id, to_doc_id FROM LinkGraph')
+        return self.cursor.fetchall()
+
     def update_page_ranks(self, page_ranks: Dict[int, float]):
         """
         Update PageRank scores for all documents
@@ -243,7 +348,12 @@ class SearchEngineDB:
             self.cursor.execute('''
                 UPDATE DocumentIndex SET page_rank = ? WHERE doc_id = ?
             ''', (rank, doc_id))
-        self.conn.commit()
+        self._commit()
+
+    def analyze(self):
+        """Refresh the query planner's statistics once the index has been built"""
+        self.cursor.execute('ANALYZE')
+        self._commit()
 
     def get_all_documents(self) -> List[Tuple[int, str, str, float]]:
         """
@@ -11,7 +11,9 @@ import unittest
 import os
 import sqlite3
 from storage import SearchEngineDB
-from pagerank import page_rank, normalize_page_rank
+from pagerank import page_rank, page_rank_edges, normalize_page_rank
+from ranking import AdvancedRanker
+from analytics import SearchAnalytics
 
 
 class TestPageRank(unittest.TestCase):
@@ -59,6 +61,35 @@ class TestPageRank(unittest.TestCase):
         self.assertGreater(scores[1], 0)
         self.assertGreater(scores[2], 0)
 
+    def test_early_exit(self):
+        """Test converged scores match a run with many more iterations"""
+        links = {
+            1: [2, 3],
+            2: [3],
+            3: [1]
+        }
+        converged = page_rank(links, num_iterations=1000, tol=1e-10)
+        early = page_rank(links, num_iterations=1000, tol=1e-6)
+
+        for page_id in links:
+            self.assertAlmostEqual(early[page_id], converged[page_id], places=4)
+
+    def test_edges_match_dict(self):
+        """Test PageRank from (from, to) pairs matches the dictionary form"""
+        links = {
+            1: [2, 3],
+            2: [3],
+            3: [1],
+            4: [1]
+        }
+        edges = [(1, 2), (1, 3), (2, 3), (3, 1), (4, 1), (1, 2)]  # (1, 2) repeated
+        expected = page_rank(links, num_iterations=50)
+        scores = page_rank_edges(edges, num_iterations=50)
+
+        self.assertEqual(set(scores), set(expected))
+        for page_id in expected:
+            self.assertAlmostEqual(scores[page_id], expected[page_id], places=6)
+
     def test_normalize(self):
         """Test PageRank normalization"""
         scores = {1: 10.0, 2: 20.0, 3: 30.0}
@@ -77,17 +108,12 @@ class TestSearchEngineDB(unittest.TestCase):
     """Test cases for database storage"""
 
     def setUp(self):
-        """Set up test database"""
-        self.test_db = 'test_search.db'
-        if os.path.exists(self.test_db):
-            os.remove(self.test_db)
-        self.db = SearchEngineDB(self.test_db)
+        """Set up in-memory test database"""
+        self.db = SearchEngineDB(':memory:')
 
     def tearDown(self):
         """Clean up test database"""
         self.db.close()
-        if os.path.exists(self.test_db):
-            os.remove(self.test_db)
 
     def test_insert_word(self):
         """Test inserting words into lexicon"""
@@ -111,6 +137,14 @@ class TestSearchEngineDB(unittest.TestCase):
         self.assertEqual(doc_id1, doc_id3)  # Duplicate should return same ID
         self.assertNotEqual(doc_id1, doc_id2)
 
+    def test_id_maps(self):
+        """Test the lexicon and document id maps"""
+        word_id = self.db.insert_word("python")
+        doc_id = self.db.insert_document("http://example.com")
+
+        self.assertEqual(self.db.get_word_ids(), {"python": word_id})
+        self.assertEqual(self.db.get_doc_ids(), {"http://example.com": doc_id})
+
     def test_update_document_title(self):
         """Test updating document title"""
         doc_id = self.db.insert_document("http://example.com", "Old Title")
@@ -137,6 +171,23 @@ class TestSearchEngineDB(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0][0], "http://example.com")
 
+    def test_inverted_index_many(self):
+        """Test batch inverted index inserts keep the last font size per word"""
+        word_id1 = self.db.insert_word("batch")
+        word_id2 = self.db.insert_word("insert")
+        doc_id = self.db.insert_document("http://example.com")
+
+        self.db.insert_inverted_index_many([
+            (word_id1, doc_id, 1), (word_id2, doc_id, 3), (word_id1, doc_id, 7)
+        ])
+        self.db.insert_links_many([(doc_id, doc_id), (doc_id, doc_id)])
+
+        self.db.cursor.execute('SELECT font_size FROM InvertedIndex WHERE word_id = ?', (word_id1,))
+        self.assertEqual(self.db.cursor.fetchall(), [(7,)])
+        stats = self.db.get_statistics()
+        self.assertEqual(stats['total_index_entries'], 2)
+        self.assertEqual(stats['total_links'], 1)
+
     def test_link_graph(self):
         """Test link graph operations"""
         doc_id1 = self.db.insert_document("http://example.com/page1")
@@ -217,39 +268,35 @@ class TestIntegration(unittest.TestCase):
     """Integration tests for complete workflow"""
 
     def setUp(self):
-        """Set up test database"""
-        self.test_db = 'test_integration.db'
-        if os.path.exists(self.test_db):
-            os.remove(self.test_db)
-        self.db = SearchEngineDB(self.test_db)
+        """Set up in-memory test database"""
+        self.db = SearchEngineDB(':memory:')
 
     def tearDown(self):
         """Clean up test database"""
         self.db.close()
-        if os.path.exists(self.test_db):
-            os.remove(self.test_db)
 
     def test_complete_workflow(self):
         """Test complete indexing and search workflow"""
-        # Step 1: Index some documents
-        doc1 = self.db.insert_document("http://test.com/python", "Python Tutorial")
-        doc2 = self.db.insert_document("http://test.com/java", "Java Guide")
-        doc3 = self.db.insert_document("http://test.com/programming", "Programming Basics")
-
-        # Step 2: Add words to documents
-        python_id = self.db.insert_word("python")
-        java_id = self.db.insert_word("java")
-        programming_id = self.db.insert_word("programming")
-
-        self.db.insert_inverted_index(python_id, doc1, 7)
-        self.db.insert_inverted_index(programming_id, doc1, 3)
-        self.db.insert_inverted_index(java_id, doc2, 7)
-        self.db.insert_inverted_index(programming_id, doc2, 3)
-        self.db.insert_inverted_index(programming_id, doc3, 7)
-
-        # Step 3: Add links
-        self.db.insert_link(doc1, doc3)
-        self.db.insert_link(doc2, doc3)
+        with self.db.bulk():
+            # Step 1: Index some documents
+            doc1 = self.db.insert_document("http://test.com/python", "Python Tutorial")
+            doc2 = self.db.insert_document("http://test.com/java", "Java Guide")
+            doc3 = self.db.insert_document("http://test.com/programming", "Programming Basics")
+
+            # Step 2: Add words to documents
+            python_id = self.db.insert_word("python")
+            java_id = self.db.insert_word("java")
+            programming_id = self.db.insert_word("programming")
+
+            self.db.insert_inverted_index(python_id, doc1, 7)
+            self.db.insert_inverted_index(programming_id, doc1, 3)
+            self.db.insert_inverted_index(java_id, doc2, 7)
+            self.db.insert_inverted_index(programming_id, doc2, 3)
+            self.db.insert_inverted_index(programming_id, doc3, 7)
+
+            # Step 3: Add links
+            self.db.insert_link(doc1, doc3)
+            self.db.insert_link(doc2, doc3)
 
         # Step 4: Compute PageRank
         links = self.db.get_link_graph()
@@ -268,6 +315,136 @@ class TestIntegration(unittest.TestCase):
         # doc3 should have highest PageRank (receives 2 links)
         self.assertEqual(programming_results[0][0], "http://test.com/programming")
 
+    def test_ranked_pages(self):
+        """Test ranking one page at a time matches slicing the full ranking"""
+        with self.db.bulk():
+            search_id = self.db.insert_word("search")
+            engine_id = self.db.insert_word("engine")
+            for i in range(12):
+                doc_id = self.db.insert_document(f"http://test.com/{i}", f"Page {i}")
+                self.db.insert_inverted_index(search_id, doc_id, 1 + i % 7)
+                if i % 2:
+                    self.db.insert_inverted_index(engine_id, doc_id, 3)
+                self.db.update_page_ranks({doc_id: i / 12})
+
+        ranker = AdvancedRanker(self.db)
+        # A repeated word must not turn the intersection into a union
+        for words, expected_total in ((["search"], 12), (["search", "engine"], 6),
+                                      (["search", "engine", "search"], 6)):
+            ranking = ranker.rank_multi_word(words, limit=100)
+            self.assertEqual(len(ranking), expected_total)
+
+            pages = []
+            for offset in range(0, 15, 5):
+                total, page = ranker.rank_page(words, offset=offset, limit=5)
+                self.assertEqual(total, expected_total)
+                pages.extend(page)
+            self.assertEqual(pages, ranking)
+
+        self.assertEqual(ranker.rank_page([], offset=0, limit=5), (0, []))
+
+    def test_ranker_clear_caches(self):
+        """Test the ranker sees index updates once its caches are cleared"""
+        word_id = self.db.insert_word("cache")
+        self.db.insert_inverted_index(word_id, self.db.insert_document("http://test.com/1"), 3)
+
+        ranker = AdvancedRanker(self.db)
+        self.assertEqual(ranker.rank_page(["cache"])[0], 1)
+        self.assertEqual(ranker.rank_page(["missing"])[0], 0)
+
+        self.db.insert_inverted_index(word_id, self.db.insert_document("http://test.com/2"), 3)
+        self.db.insert_inverted_index(self.db.insert_word("missing"), self.db.insert_document("http://test.com/3"), 3)
+
+        ranker.clear_caches()
+        self.assertEqual(ranker.total_docs, 3)
+        self.assertEqual(ranker.rank_page(["cache"])[0], 2)
+        self.assertEqual(ranker.rank_page(["missing"])[0], 1)
+
+    def test_ranker_follows_other_connection(self):
+        """Test the ranker sees words another connection adds, without clear_caches"""
+        test_db = 'test_ranker_refresh.db'
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+        try:
+            with SearchEngineDB(test_db) as reader, SearchEngineDB(test_db) as writer:
+                ranker = AdvancedRanker(reader)
+                self.assertEqual(ranker.rank_page(["fresh"])[0], 0)
+
+                doc_id = writer.insert_document("http://test.com/fresh", "Fresh Page")
+                writer.insert_inverted_index(writer.insert_word("fresh"), doc_id, 3)
+
+                self.assertEqual(ranker.rank_page(["fresh"])[0], 1)
+                self.assertEqual(ranker.total_docs, 1)
+        finally:
+            if os.path.exists(test_db):
+                os.remove(test_db)
+
+    def test_bulk_rollback(self):
+        """Test a failing bulk block leaves no partial data behind"""
+        with self.assertRaises(RuntimeError):
+            with self.db.bulk():
+                self.db.insert_document("http://test.com/partial", "Partial")
+                self.db.insert_word("partial")
+                raise RuntimeError("crawl aborted")
+
+        stats = self.db.get_statistics()
+        self.assertEqual(stats['total_documents'], 0)
+        self.assertEqual(stats['total_words'], 0)
+
+    def test_persistence(self):
+        """Test data written to a database file survives reopening it"""
+        test_db = 'test_persistence.db'
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+        try:
+            db = SearchEngineDB(test_db)
+            doc_id = db.insert_document("http://test.com/saved", "Saved Page")
+            word_id = db.insert_word("saved")
+            db.insert_inverted_index(word_id, doc_id, 5)
+            db.close()
+
+            db = SearchEngineDB(test_db)
+            results = db.search_word("saved")
+            db.close()
+            self.assertEqual(len(results), 1)
+            self.assertEqual(results[0][0], "http://test.com/saved")
+        finally:
+            if os.path.exists(test_db):
+                os.remove(test_db)
+
+
+class TestSearchAnalytics(unittest.TestCase):
+    """Test cases for query analytics"""
+
+    def setUp(self):
+        """Set up in-memory analytics database"""
+        self.analytics = SearchAnalytics(':memory:')
+
+    def tearDown(self):
+        """Close analytics database"""
+        self.analytics.close()
+
+    def test_click_batch_ctr(self):
+        """Test a batch of clicks counts towards the CTR of a just-logged query"""
+        query_id = self.analytics.log_query('python', 5, 12.0)
+        other_id = self.analytics.log_query('java', 3, 10.0)
+        self.analytics.log_clicks_batch([(query_id, 'http://test.com/1', 1),
+                                         (query_id, 'http://test.com/2', 2),
+                                         (other_id, 'http://test.com/3', 1)])
+        self.analytics.log_query('python', 5, 11.0)
+
+        popular = {query: (count, ctr) for query, count, ctr in self.analytics.get_popular_queries()}
+        self.assertEqual(popular['python'], (2, 1.0))
+        self.assertEqual(popular['java'], (1, 1.0))
+
+    def test_close_twice(self):
+        """Test closing analytics again (as the atexit hook may) does nothing"""
+        self.analytics.log_query_async('python', 5, 12.0)
+        self.analytics.close()
+        self.analytics.close()
+
 
 def run_tests():
     """Run all tests"""
@@ -278,6 +455,7 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestPageRank))
     suite.addTests(loader.loadTestsFromTestCase(TestSearchEngineDB))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
+    suite.addTests(loader.loadTestsFromTestCase(TestSearchAnalytics))
 
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
@@ -116,6 +116,8 @@ def test_analytics():
             q2 = analytics.log_query('python programming', 48, 98.2)
             q3 = analytics.log_query('web development', 30, 150.0)
             print(f"   Logged 3 queries (IDs: {q1}, {q2}, {q3})")
+            analytics.log_query_async('web development', 28, 80.0)
+            print("   Queued 1 query for the background writer")
 
             # Test click logging
             print("\n2. Testing click logging...")